@@ -4,11 +4,17 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Таблицы, которые создаёт только alembic: main стартует одновременно с сервисом
+# migrations, и create_all мог бы успеть раньше миграции — та упала бы на
+# DuplicateTable и откатила всю цепочку upgrade
+MIGRATION_ONLY_TABLES = {"broadcast_logs"}
+
 
 async def init_db():
     try:
         async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
+            tables = [t for t in Base.metadata.sorted_tables if t.name not in MIGRATION_ONLY_TABLES]
+            await conn.run_sync(Base.metadata.create_all, tables=tables)
         logger.info("✅ Таблицы успешно инициализированы.")
     except Exception as e:
         logger.error(f"❌ Ошибка при инициализации базы: {e}")
@@ -1,17 +1,23 @@
 # app/main_bot/database/base/session.py
 
+import os
+
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
 from app.main_bot.config.config import settings
 
 DATABASE_URL = settings.database_url
 
-# ✅ Увеличиваем пул соединений
+# ✅ Увеличиваем пул соединений. Пул — на процесс: supervisor join_worker
+# делит общий бюджет между своими процессами через эти переменные
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 20))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 40))
+
 engine = create_async_engine(
     DATABASE_URL,
     echo=False,
-    pool_size=20,
-    max_overflow=40,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
     pool_timeout=15,
 )
 
@@ -2,3 +2,4 @@ from .bot import Bot
 from .user import User
 from .channel import Channel
 from .member import ChannelMember
+from .broadcast_log import BroadcastLog
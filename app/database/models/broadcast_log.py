@@ -1,8 +1,13 @@
-from sqlalchemy import Column, Integer, BigInteger, Text, DateTime, func, Boolean, JSON
+from sqlalchemy import Column, Integer, BigInteger, Text, String, DateTime, func, Boolean, JSON, Index
 from app.database.base.base_model import Base
 
 
 class BroadcastLog(Base):
+    """
+    Рассылка как задание: воркер берёт его в аренду (locked_by/locked_until)
+    и после каждой пачки сохраняет счётчики и курсор last_user_id.
+    Если воркер умер, любой другой продолжит с последней пачки.
+    """
     __tablename__ = "broadcast_logs"
 
     id = Column(Integer, primary_key=True)
@@ -11,12 +16,25 @@ class BroadcastLog(Base):
     successful = Column(Integer, default=0)
     failed = Column(Integer, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     message_text = Column(Text, nullable=False)
     button_text = Column(Text)
     button_url = Column(Text)
 
+    # Аудитория — channels.id; получатели читаются по user_id после курсора
+    channel_ids = Column(JSON(none_as_null=True))
+    last_user_id = Column(BigInteger)
+
     progress_chat_id = Column(BigInteger)
     progress_message_id = Column(BigInteger)
 
+    locked_by = Column(String)
+    locked_until = Column(DateTime(timezone=True))
+
     completed = Column(Boolean, default=False)
+
+    __table_args__ = (
+        # Поиск брошенных рассылок: только незавершённые
+        Index("ix_broadcast_logs_pending", "locked_until", postgresql_where=completed.is_(False)),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, func
 from sqlalchemy.orm import relationship
 
 from app.database.base.base_model import Base
@@ -36,4 +36,7 @@ class Channel(Base):
 
     auto_approve_mode = Column(String, default="none")
 
+    # По нему join-воркеры забирают только изменённые каналы
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
+
     bot = relationship("Bot", back_populates="channels")
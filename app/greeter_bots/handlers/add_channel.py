@@ -7,6 +7,7 @@ from app.greeter_bots.keyboards.channel_settings import channel_settings_keyboar
 from app.greeter_bots.states.add_channel import AddChannelState
 from app.database.models.channel import Channel
 from app.redis_queue.admin_logs import send_log_to_admin
+from workers.join_worker.services.channel_cache import refresh_channel_cache
 
 
 def get_router() -> Router:
@@ -63,6 +64,7 @@ def get_router() -> Router:
             )
             session.add(channel)
             await session.commit()
+            await refresh_channel_cache(channel.id)
 
             await send_log_to_admin(
                 f"✅ Пользователь @{message.from_user.username} (ID: {message.from_user.id}) добавил канал "
@@ -10,6 +10,7 @@ from app.database.models.channel import Channel
 from app.greeter_bots.keyboards.autoapprove_menu import autoapprove_keyboard
 from app.redis_queue.admin_logs import send_log_to_admin
 from app.utils.logger import logger
+from workers.join_worker.services.channel_cache import refresh_channel_cache
 
 class AutoApproveState(StatesGroup):
     waiting_for_seconds = State()
@@ -71,6 +72,8 @@ def get_router(bot_id: int) -> Router:
             )
             await session.commit()
 
+        await refresh_channel_cache(channel_id)
+
         log_text = (
             f"✅ Пользователь @{callback.from_user.username} (ID: {callback.from_user.id}) "
             f"установил автоодобрение: {mode} для канала ID {channel_id}"
@@ -118,6 +121,8 @@ def get_router(bot_id: int) -> Router:
             )
             await session.commit()
 
+        await refresh_channel_cache(channel_id)
+
         log_text = (
             f"🕒 Пользователь @{message.from_user.username} (ID: {message.from_user.id}) "
             f"установил автоодобрение: {seconds} сек для канала ID {channel_id}"
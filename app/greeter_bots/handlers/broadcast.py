@@ -3,9 +3,10 @@ from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy import select
+from sqlalchemy import distinct, func, select
 
 from app.database.base.session import async_session
+from app.database.models.broadcast_log import BroadcastLog
 from app.database.models.channel import Channel
 from app.database.models.member import ChannelMember
 from app.greeter_bots.states.broadcast import BroadcastState
@@ -214,38 +215,53 @@ def get_router() -> Router:
             channels = result.scalars().all()
             channel_ids = [ch.id for ch in channels]
 
-            members_result = await session.execute(
-                select(ChannelMember.user_id).where(
+            # Получателей не выгружаем: воркер сам читает их из базы постранично
+            total = await session.scalar(
+                select(func.count(distinct(ChannelMember.user_id))).where(
                     ChannelMember.channel_id.in_(channel_ids),
                     ChannelMember.bot_id == bot_id,
                     ChannelMember.is_available_for_broadcast.is_(True)  # ✅ Только доступные для рассылки
                 )
             )
 
-            user_ids = {row[0] for row in members_result.fetchall()}
+            # Сначала сохраняем задание: если задача потеряется в Redis или воркер упадёт,
+            # рассылку подхватит другой воркер по broadcast_logs
+            broadcast = BroadcastLog(
+                bot_id=bot_id,
+                total_users=total,
+                message_text=text,
+                button_text=button_text,
+                button_url=button_url,
+                channel_ids=channel_ids,
+                progress_chat_id=message.chat.id,
+            )
+            session.add(broadcast)
+            await session.commit()
 
         # 🔁 Вместо отправки — кладём задачу в Redis
         await enqueue_broadcast_task(
             bot_id=bot_id,
             text=text,
-            user_ids=list(user_ids),
+            channel_ids=channel_ids,
+            total=total,
             button_text=button_text,
             button_url=button_url,
             response_chat_id=message.chat.id,
-            response_message_id=message.message_id
+            response_message_id=message.message_id,
+            broadcast_id=broadcast.id,
         )
 
         builder = InlineKeyboardBuilder()
         builder.button(text="⬅ В главное меню", callback_data="back_to_main_menu")
 
         await message.answer(
-            f"✅ Рассылка запущена в фоне. Всего в боте: {len(user_ids)}. "
+            f"✅ Рассылка запущена в фоне. Всего в боте: {total}. "
             f"Ожидайте ⏳",
             reply_markup=builder.as_markup()
         )
 
         log_text = (
-            f"🚀 Запущена рассылка (bot_id={bot_id}) | каналов: {len(channel_ids)} | пользователей: {len(user_ids)} "
+            f"🚀 Запущена рассылка (bot_id={bot_id}) | каналов: {len(channel_ids)} | пользователей: {total} "
             f"| кнопка: {'да' if button_text and button_url else 'нет'}"
         )
         await send_log_to_admin(log_text)
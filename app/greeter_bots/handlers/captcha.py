@@ -10,6 +10,7 @@ from app.database.base.session import async_session
 from app.database.models.channel import Channel
 from app.utils.logger import logger
 from app.redis_queue.admin_logs import send_log_to_admin  # <-- меняй путь на правильный, если нужно.
+from workers.join_worker.services.channel_cache import refresh_channel_cache
 
 class CaptchaTextState(StatesGroup):
     waiting_for_text = State()
@@ -35,6 +36,8 @@ def get_router() -> Router:
             )
             await session.commit()
 
+        await refresh_channel_cache(int(channel_id))
+
     @router.callback_query(F.data.startswith("captcha_menu:"))
     async def open_captcha_menu(callback: types.CallbackQuery):
         channel_id = int(callback.data.split(":")[1])
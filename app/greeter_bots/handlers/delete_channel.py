@@ -1,6 +1,6 @@
 from aiogram import Router, F, types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from sqlalchemy import delete
+from sqlalchemy import delete, select
 from app.database.base.session import async_session
 from app.database.models import ChannelMember
 from app.database.models.channel import Channel
@@ -9,6 +9,7 @@ from app.redis_queue.admin_logs import send_log_to_admin
 
 # Импортируем функцию удаления из кеша
 from workers.join_worker.services.channel_cache import remove_channel_from_cache
+from workers.join_worker.services.member_index import drop_member_index
 
 def get_router() -> Router:
     router = Router()
@@ -56,6 +57,12 @@ def get_router() -> Router:
         logger.info(log_text)
 
         async with async_session() as session:
+            # Кеш каналов ключуется по Telegram ID канала, а не по channels.id
+            result = await session.execute(
+                select(Channel.channel_id).where(Channel.id == channel_id, Channel.bot_id == bot_id)
+            )
+            tg_channel_id = result.scalar_one_or_none()
+
             # Удаляем участников канала
             await session.execute(
                 delete(ChannelMember).where(ChannelMember.channel_id == channel_id)
@@ -75,7 +82,9 @@ def get_router() -> Router:
             logger.info(log_text)
 
         # Удаляем канал из кеша
-        await remove_channel_from_cache(channel_id, bot_id)
+        if tg_channel_id:
+            await remove_channel_from_cache(tg_channel_id, bot_id)
+        await drop_member_index(channel_id, bot_id)
 
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_main_menu")]
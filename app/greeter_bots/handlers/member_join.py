@@ -1,13 +1,12 @@
 #app/greeter_bots/handlers/member_join.py
 import asyncio
-import json
 
 from aiogram import Router
 
 from aiogram.types import ChatJoinRequest, ChatMemberUpdated
 
 from app.redis_queue.admin_logs import send_log_to_admin
-from app.redis_queue.connection import redis
+from app.redis_queue.join_queue import JOIN_REQUEST, MEMBER_JOINED, enqueue_join_event
 from app.utils.logger import logger
 
 
@@ -33,9 +32,8 @@ def get_router(bot_id: int) -> Router:
                 f"👥 Пользователь <code>{user_id}</code> вступил в <code>{chat_id}</code> (bot_id={bot_id})"
             )
 
-            await redis.rpush(
-                "join_queue",
-                json.dumps({"user_id": user_id, "chat_id": chat_id, "bot_id": bot_id}),
+            await enqueue_join_event(
+                user_id=user_id, chat_id=chat_id, bot_id=bot_id, kind=MEMBER_JOINED
             )
 
             # logger.info(f"📤 Задача добавлена в Redis для user_id={user_id}")
@@ -52,10 +50,12 @@ def get_router(bot_id: int) -> Router:
             #     f"📨 Запрос на вступление от <code>{user_id}</code> в <code>{chat_id}</code> (bot_id={bot_id})"
             # )
 
-            await redis.rpush(
-                "join_queue",
-                json.dumps({"user_id": user_id, "chat_id": chat_id, "bot_id": bot_id}),
+            queued = await enqueue_join_event(
+                user_id=user_id, chat_id=chat_id, bot_id=bot_id, kind=JOIN_REQUEST
             )
+            if not queued:
+                logger.info(f"♻️ Дубликат заявки отброшен: user_id={user_id}, chat_id={chat_id}")
+                return
 
             logger.info(f"📤 Задача добавлена в Redis для user_id={user_id}")
             # await send_log_to_admin(f"📤 Задача на join_request отправлена в Redis (user_id={user_id})")
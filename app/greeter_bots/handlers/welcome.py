@@ -10,6 +10,7 @@ from app.greeter_bots.states.welcome import WelcomeState
 from app.greeter_bots.keyboards.welcome_menu import welcome_menu_keyboard
 from app.utils.logger import logger
 from app.redis_queue.admin_logs import send_log_to_admin  # поправь, если название иное
+from workers.join_worker.services.channel_cache import refresh_channel_cache
 
 def get_router() -> Router:
     router = Router()
@@ -49,6 +50,8 @@ def get_router() -> Router:
             channel.welcome_enabled = not channel.welcome_enabled
             await session.commit()
 
+        await refresh_channel_cache(channel_id)
+
         status = "✅ Включено" if channel.welcome_enabled else "❌ Выключено"
         log_text = (
             f"🔁 @{callback.from_user.username} (ID: {callback.from_user.id}) "
@@ -90,6 +93,8 @@ def get_router() -> Router:
             )
             await session.commit()
 
+        await refresh_channel_cache(channel_id)
+
         log_text = (
             f"💬 @{message.from_user.username} (ID: {message.from_user.id}) "
             f"обновил текст приветствия для канала ID={channel_id}\n"
@@ -151,6 +156,8 @@ def get_router() -> Router:
             )
             await session.commit()
 
+        await refresh_channel_cache(channel_id)
+
         log_text = (
             f"🔗 @{message.from_user.username} (ID: {message.from_user.id}) "
             f"обновил кнопку приветствия: [{button_text}]({button_url}) для канала {channel_id}"
@@ -18,6 +18,7 @@ import asyncio
 
 from app.utils.docker_service import create_greeter_service
 from app.utils.logger import logger
+from workers.join_worker.services.bot_cache import notify_bots_changed
 
 router = Router()
 
@@ -118,6 +119,9 @@ async def process_token(message: types.Message, state: FSMContext):
         await session.commit()
         bot_id = bot_entry.id  # получаем ID добавленного бота
 
+    # Join-воркеры подхватят нового бота без полного перечитывания кеша
+    await notify_bots_changed()
+
     # 🟢 Автоматический запуск greeter_bot
     await message.answer(f"✅ Бот @{bot_info.username} успешно добавлен и запущен!", reply_markup=back_to_main_menu_keyboard)
 
@@ -6,6 +6,8 @@ from app.database.models.bot import Bot as BotModel
 from app.database.models.channel import Channel
 from app.database.models.member import ChannelMember
 from app.utils.logger import logger
+from workers.join_worker.services.bot_cache import notify_bots_changed
+from workers.join_worker.services.member_index import drop_member_index
 import docker
 
 router = Router()
@@ -46,6 +48,9 @@ async def delete_bot(callback: types.CallbackQuery, state: FSMContext):
         await session.delete(bot)
         await session.commit()
         logger.info(f"✅ Бот @{username} удалён из базы (ID: {bot_id})")
+        await notify_bots_changed()
+        for channel_pk in channel_ids:
+            await drop_member_index(channel_pk, bot_id)
 
         # 🛑 4. Удаляем greeter-сервис Docker
         deleted = remove_docker_service(bot_id)
@@ -1,10 +1,9 @@
 # app/redis_queue/admin_log.py
 
-import json
-
-from app.redis_queue.connection import redis
+from app.redis_queue.codec import encode_message
+from app.redis_queue.connection import redis_raw
 
 
 async def send_log_to_admin(text: str, level: str = "info"):
     """Кладёт лог в Redis, откуда его заберёт воркер"""
-    await redis.rpush("admin_logs", json.dumps({"message": text, "level": level}))
+    await redis_raw.rpush("admin_logs", encode_message({"message": text, "level": level}))
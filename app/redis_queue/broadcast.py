@@ -1,27 +1,107 @@
-import json
+# app/redis_queue/broadcast.py
 
-from app.redis_queue.connection import redis
+from app.redis_queue.codec import decode_message, encode_message
+from app.redis_queue.connection import redis_raw
+from app.utils.logger import logger
+
+BROADCAST_QUEUE_PREFIX = "broadcast_tasks:"
+# Боты с непустой очередью рассылок: bot_id -> когда бот встал в очередь.
+# Воркеры ждут на нём одним BZPOPMIN вместо KEYS + BLPOP по каждой очереди
+BROADCAST_READY = "broadcast_ready"
+
+# Атомарно: задача в очередь бота + бот в ready (NX — не сдвигаем его место)
+# KEYS: [очередь бота, ready]
+# ARGV: [задача, bot_id]
+_enqueue_script = redis_raw.register_script(
+    """
+    redis.call('RPUSH', KEYS[1], ARGV[1])
+    local t = redis.call('TIME')
+    redis.call('ZADD', KEYS[2], 'NX', tonumber(t[1]) + tonumber(t[2]) / 1000000, ARGV[2])
+    return 1
+    """
+)
+
+# Забирает одну задачу бота. Если у бота есть ещё — возвращаем его в конец ready,
+# чтобы следующая его рассылка шла после уже ждущих ботов.
+# KEYS: [очередь бота, ready]
+# ARGV: [bot_id]
+_pop_script = redis_raw.register_script(
+    """
+    local task = redis.call('LPOP', KEYS[1])
+    if redis.call('LLEN', KEYS[1]) > 0 then
+        local t = redis.call('TIME')
+        redis.call('ZADD', KEYS[2], tonumber(t[1]) + tonumber(t[2]) / 1000000, ARGV[1])
+    end
+    return task
+    """
+)
+
+
+def _make_queue(bot_id: int) -> str:
+    return f"{BROADCAST_QUEUE_PREFIX}{bot_id}"
 
 
-# redis_queue/broadcast.py
 async def enqueue_broadcast_task(
     bot_id: int,
     text: str,
-    user_ids: list[int],
+    channel_ids: list[int],
+    total: int,
     button_text: str = None,
     button_url: str = None,
     response_chat_id: int = None,
     response_message_id: int = None,
+    broadcast_id: int = None,
 ):
     task = {
         "bot_id": bot_id,
+        # Задание в broadcast_logs: воркер берёт его в аренду и ведёт по нему прогресс
+        "broadcast_id": broadcast_id,
         "text": text,
-        "user_ids": user_ids,
+        # Аудитория — участники этих каналов (channels.id), доступные для рассылки.
+        # Сами user_id в задачу не кладём: воркер читает их постранично
+        "channel_ids": channel_ids,
+        "total": total,
         "button_text": button_text,
         "button_url": button_url,
         "response_chat_id": response_chat_id,
         "response_message_id": response_message_id,
     }
 
-    queue_name = f"broadcast_tasks:{bot_id}"
-    await redis.rpush(queue_name, json.dumps(task))
+    await _enqueue_script(keys=[_make_queue(bot_id), BROADCAST_READY], args=[encode_message(task), bot_id])
+
+
+async def dequeue_broadcast_task(timeout: float) -> dict | None:
+    """Ждёт любого бота с задачами не дольше timeout и забирает его первую задачу"""
+    ready = await redis_raw.bzpopmin(BROADCAST_READY, timeout=timeout)
+    if not ready:
+        return None
+
+    _, bot_id, _ = ready
+    bot_id = int(bot_id)
+    # Задачу мог уже забрать другой воркер
+    data = await _pop_script(keys=[_make_queue(bot_id), BROADCAST_READY], args=[bot_id])
+    if not data:
+        return None
+
+    try:
+        return decode_message(data)
+    except ValueError:
+        logger.warning(f"⚠️ Skipping malformed broadcast task for bot_id={bot_id}: {data!r}")
+        return None
+
+
+async def register_pending_queues() -> int:
+    """
+    Ставит в ready ботов, у которых уже есть задачи: очереди от старых продюсеров
+    и очереди, чей бот потерялся при падении воркера. SCAN не блокирует Redis.
+    """
+    registered = 0
+    async for key in redis_raw.scan_iter(match=f"{BROADCAST_QUEUE_PREFIX}*", count=1000):
+        bot_id = key.decode()[len(BROADCAST_QUEUE_PREFIX):]
+        if bot_id.isdigit() and await redis_raw.llen(key):
+            registered += await redis_raw.zadd(BROADCAST_READY, {bot_id: 0}, nx=True)
+
+    if registered:
+        logger.info(f"📦 Registered {registered} pending broadcast queues")
+    return registered
+
@@ -5,3 +5,6 @@ from redis.asyncio import Redis
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
 redis = Redis.from_url(REDIS_URL, decode_responses=True)
+
+# Без decode_responses: очереди хранят бинарные сообщения (см. codec.py)
+redis_raw = Redis.from_url(REDIS_URL)
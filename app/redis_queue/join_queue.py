@@ -0,0 +1,450 @@
+# app/redis_queue/join_queue.py
+
+import asyncio
+import os
+import socket
+import time
+from dataclasses import dataclass, field
+
+from redis.exceptions import ResponseError
+
+from app.redis_queue.codec import decode_join_event, encode_join_event
+from app.redis_queue.connection import redis_raw
+from app.utils.logger import logger
+
+# list — Redis-списки, по одному на бота, с обходом по кругу (по умолчанию)
+# stream — Redis Stream с consumer group: у каждого события есть владелец,
+# XACK после обработки и повторная доставка упавших событий через XAUTOCLAIM.
+# Стрим общий для всех ботов, честной очерёдности между ботами в нём нет.
+# Гритеры получают значение от главного бота (docker_service); воркер на stream
+# всё равно дочитывает списки ботов — от гритеров, созданных со старыми настройками
+JOIN_QUEUE_BACKEND = os.getenv("JOIN_QUEUE_BACKEND", "list")
+
+# Легаси: один общий список. Новые события в него не пишем, но дочитываем,
+# пока в кластере остались продюсеры старой версии
+JOIN_QUEUE = "join_queue"
+
+# Для list у каждого бота своя очередь join_queue:{bot_id}. Список активных
+# (непустых) очередей воркер обходит по кругу и берёт у каждого бота не больше
+# кванта событий, поэтому всплеск у одного бота не задерживает остальных
+JOIN_BOT_QUEUE_PREFIX = "join_queue:bot:"
+JOIN_ACTIVE_BOTS = "join_queue:active"
+# Необязательные веса ботов: HSET join_queue:weights <bot_id> 2 — двойной квант
+JOIN_BOT_WEIGHTS = "join_queue:weights"
+JOIN_BOT_QUANTUM = int(os.getenv("JOIN_BOT_QUANTUM", 20))
+# Сигнал ожидающим воркерам, что появилась новая активная очередь
+JOIN_WAKEUP = "join_queue:wakeup"
+JOIN_WAKEUP_MAX = 16
+
+# Боты делятся на партиции по bot_id, у каждой партиции свой круг активных ботов
+# и свой wakeup. Число партиций должно совпадать у продюсеров и воркеров:
+# в docker-compose оно задаётся для main и join_worker, гритерам его передаёт main.
+# Процесс воркера читает только свои партиции (их раздаёт supervisor), по умолчанию — все
+JOIN_QUEUE_PARTITIONS = int(os.getenv("JOIN_QUEUE_PARTITIONS", 1))
+
+JOIN_STREAM = "join_stream"
+JOIN_STREAM_GROUP = "join_workers"
+JOIN_STREAM_MAXLEN = int(os.getenv("JOIN_STREAM_MAXLEN", 1_000_000))
+JOIN_STREAM_CLAIM_IDLE_MS = int(os.getenv("JOIN_STREAM_CLAIM_IDLE_MS", 60_000))
+JOIN_STREAM_CLAIM_INTERVAL = 10  # seconds
+# События в работе (в очереди воркера, в ожидании токенов бота) дольше CLAIM_IDLE
+# перехватила бы другая реплика. Воркер обнуляет их idle заметно чаще
+JOIN_STREAM_TOUCH_INTERVAL = JOIN_STREAM_CLAIM_IDLE_MS / 1000 / 3  # seconds
+JOIN_STREAM_MAX_DELIVERIES = 5
+JOIN_DEAD_LETTER_QUEUE = "join_queue:dead"
+
+# Окно дедупликации: повторы одного и того же события за это время в очередь не попадают.
+# 0 — дедупликация выключена. Проверяет продюсер: гритеры получают значение
+# от главного бота при создании (docker_service)
+JOIN_DEDUP_TTL = int(os.getenv("JOIN_DEDUP_TTL", 300))  # seconds
+JOIN_DEDUP_COUNTER = "join_queue:dedup_suppressed"
+
+# Виды событий вступления
+JOIN_REQUEST = "join_request"
+MEMBER_JOINED = "member"
+
+CONSUMER_NAME = f"{socket.gethostname()}:{os.getpid()}"
+
+_last_claim_time = 0.0
+
+
+def _parse_partitions(value: str | None) -> list[int]:
+    if not value:
+        return list(range(JOIN_QUEUE_PARTITIONS))
+    return [int(p) for p in value.split(",")]
+
+
+JOIN_WORKER_PARTITIONS = _parse_partitions(os.getenv("JOIN_WORKER_PARTITIONS"))
+
+
+def _make_partition_key(key: str, partition: int) -> str:
+    # Партиция 0 живёт в старых ключах — без партиций всё работает как раньше
+    return key if partition == 0 else f"{key}:{partition}"
+
+
+def get_partition(bot_id: int) -> int:
+    return bot_id % JOIN_QUEUE_PARTITIONS
+
+# Атомарно: SET NX ключа дедупликации + постановка в очередь.
+# KEYS: [ключ события, связанный ключ, очередь, счётчик, активные боты, wakeup]
+# ARGV: [ttl (0 — без дедупликации), data, backend, maxlen стрима, вид события, bot_id, wakeup max]
+# Если уже есть связанный ключ (chat_member после одобренной заявки) — событие тоже дубликат.
+_enqueue_script = redis_raw.register_script(
+    """
+    if tonumber(ARGV[1]) > 0 then
+        local suppressed = redis.call('EXISTS', KEYS[2]) == 1
+        if not suppressed then
+            suppressed = not redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[1])
+        end
+        if suppressed then
+            redis.call('HINCRBY', KEYS[4], ARGV[5], 1)
+            return 0
+        end
+    end
+
+    if ARGV[3] == 'stream' then
+        redis.call('XADD', KEYS[3], 'MAXLEN', '~', ARGV[4], '*', 'data', ARGV[2])
+    elseif redis.call('RPUSH', KEYS[3], ARGV[2]) == 1 then
+        -- Очередь бота была пустой: ставим его в круг и будим воркеры
+        redis.call('RPUSH', KEYS[5], ARGV[6])
+        redis.call('RPUSH', KEYS[6], '1')
+        redis.call('LTRIM', KEYS[6], -tonumber(ARGV[7]), -1)
+    end
+    return 1
+    """
+)
+
+# Обход по кругу активных ботов, пока батч не наберётся: каждому до quantum * weight
+# событий за заход. Бот уходит в конец круга (LMOVE), а с опустевшей очередью — из круга совсем.
+# Круги нескольких партиций чередуются. Легаси-список (если его читает этот процесс)
+# на каждом вызове получает свой квант первым.
+# Возвращает [события, сколько ещё осталось в очередях].
+# KEYS: [веса, легаси-очередь, круг партиции, ...]
+# ARGV: [max_items, quantum, префикс очередей ботов, читать ли легаси (1/0)]
+_pop_round_robin_script = redis_raw.register_script(
+    """
+    local max_items = tonumber(ARGV[1])
+    local quantum = tonumber(ARGV[2])
+    local with_legacy = ARGV[4] == '1'
+
+    local result = {}
+    if with_legacy then
+        result = redis.call('LPOP', KEYS[2], math.min(max_items, quantum)) or {}
+    end
+
+    local rings = #KEYS - 2
+    local empty = {}
+    local exhausted = 0
+    local turn = 0
+    while #result < max_items and exhausted < rings do
+        local ring = KEYS[3 + turn % rings]
+        turn = turn + 1
+
+        if not empty[ring] then
+            local bot = redis.call('LMOVE', ring, ring, 'LEFT', 'RIGHT')
+            if not bot then
+                empty[ring] = true
+                exhausted = exhausted + 1
+            else
+                local weight = tonumber(redis.call('HGET', KEYS[1], bot)) or 1
+                local count = math.min(max_items - #result, math.max(1, math.floor(quantum * weight)))
+
+                local queue = ARGV[3] .. bot
+                local items = redis.call('LPOP', queue, count)
+                if items then
+                    for _, item in ipairs(items) do
+                        result[#result + 1] = item
+                    end
+                end
+                if redis.call('LLEN', queue) == 0 then
+                    redis.call('LREM', ring, -1, bot)
+                end
+            end
+        end
+    end
+
+    -- Неполный батч — значит, все очереди уже пусты
+    if #result < max_items then
+        return {result, 0}
+    end
+    local depth = 0
+    if with_legacy then
+        depth = redis.call('LLEN', KEYS[2])
+    end
+    for i = 3, #KEYS do
+        for _, bot in ipairs(redis.call('LRANGE', KEYS[i], 0, -1)) do
+            depth = depth + redis.call('LLEN', ARGV[3] .. bot)
+        end
+    end
+    return {result, depth}
+    """
+)
+
+
+# Обнуляет idle у событий стрима, которые ещё числятся за этим consumer'ом.
+# Чужие (уже перехваченные) не трогаем — XCLAIM вернул бы их нам.
+# JUSTID не увеличивает счётчик доставок.
+# KEYS: [стрим]
+# ARGV: [группа, consumer, id, ...]
+_touch_script = redis_raw.register_script(
+    """
+    local touched = 0
+    for i = 3, #ARGV do
+        local pending = redis.call('XPENDING', KEYS[1], ARGV[1], ARGV[i], ARGV[i], 1)
+        if pending[1] and pending[1][2] == ARGV[2] then
+            redis.call('XCLAIM', KEYS[1], ARGV[1], ARGV[2], 0, ARGV[i], 'JUSTID')
+            touched = touched + 1
+        end
+    end
+    return touched
+    """
+)
+
+
+@dataclass
+class JoinBatch:
+    payloads: list[dict] = field(default_factory=list)
+    # ID записей стрима, которые нужно подтвердить после обработки (только для stream)
+    ack_ids: list[bytes] = field(default_factory=list)
+    # Сколько событий осталось в очереди после этого батча; None — неизвестно
+    depth: int | None = 0
+
+
+def _decode(item: bytes) -> dict | None:
+    try:
+        return decode_join_event(item)
+    except ValueError:
+        logger.warning(f"⚠️ Skipping malformed join event: {item!r}")
+        return None
+
+
+def _make_dedup_key(user_id: int, chat_id: int, bot_id: int, kind: str) -> str:
+    return f"join_dedup:{bot_id}:{chat_id}:{user_id}:{kind}"
+
+
+def _make_bot_queue(bot_id: int) -> str:
+    return f"{JOIN_BOT_QUEUE_PREFIX}{bot_id}"
+
+
+async def enqueue_join_event(user_id: int, chat_id: int, bot_id: int, kind: str = JOIN_REQUEST) -> bool:
+    """
+    Кладёт событие вступления в очередь для join_worker.
+    Возвращает False, если событие отброшено как дубликат.
+    """
+    # chat_member после одобренной заявки — то же вступление, его не обрабатываем повторно
+    related_kind = JOIN_REQUEST if kind == MEMBER_JOINED else kind
+    queued = await _enqueue_script(
+        keys=[
+            _make_dedup_key(user_id, chat_id, bot_id, kind),
+            _make_dedup_key(user_id, chat_id, bot_id, related_kind),
+            JOIN_STREAM if JOIN_QUEUE_BACKEND == "stream" else _make_bot_queue(bot_id),
+            JOIN_DEDUP_COUNTER,
+            _make_partition_key(JOIN_ACTIVE_BOTS, get_partition(bot_id)),
+            _make_partition_key(JOIN_WAKEUP, get_partition(bot_id)),
+        ],
+        args=[
+            JOIN_DEDUP_TTL,
+            encode_join_event(user_id, chat_id, bot_id),
+            JOIN_QUEUE_BACKEND,
+            JOIN_STREAM_MAXLEN,
+            kind,
+            bot_id,
+            JOIN_WAKEUP_MAX,
+        ],
+    )
+    return bool(queued)
+
+
+async def init_join_queue():
+    """
+    Подготовка очереди при старте воркера. Для stream создаём consumer group
+    и переносим в стрим всё, что осталось в старом списке join_queue.
+    """
+    if JOIN_QUEUE_BACKEND != "stream":
+        return
+
+    await _ensure_stream_group()
+
+    moved = 0
+    while True:
+        items = await redis_raw.lpop(JOIN_QUEUE, 500)
+        if not items:
+            break
+
+        pipe = redis_raw.pipeline()
+        for item in items:
+            pipe.xadd(JOIN_STREAM, {"data": item}, maxlen=JOIN_STREAM_MAXLEN, approximate=True)
+        await pipe.execute()
+        moved += len(items)
+
+    if moved:
+        logger.info(f"📦 Moved {moved} legacy join events from {JOIN_QUEUE} to {JOIN_STREAM}")
+
+
+async def _ensure_stream_group():
+    try:
+        await redis_raw.xgroup_create(JOIN_STREAM, JOIN_STREAM_GROUP, id="0", mkstream=True)
+        logger.info(f"✅ Created consumer group {JOIN_STREAM_GROUP} on {JOIN_STREAM}")
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def dequeue_join_batch(max_items: int, timeout: float, linger: float = 0) -> JoinBatch:
+    """
+    timeout — сколько ждать первого события в пустой очереди.
+    linger — сколько ещё подождать, если батч набрался не полностью.
+    """
+    if JOIN_QUEUE_BACKEND == "stream":
+        return await _dequeue_stream_batch(max_items, timeout, linger)
+    return await _dequeue_list_batch(max_items, timeout, linger)
+
+
+async def ack_join_batch(batch: JoinBatch):
+    """Подтверждает обработку батча. Для списка ничего не делает."""
+    if batch.ack_ids:
+        await redis_raw.xack(JOIN_STREAM, JOIN_STREAM_GROUP, *batch.ack_ids)
+
+
+async def touch_join_events(ack_ids: list[bytes]) -> int:
+    """Продлевает владение событиями стрима, которые ещё обрабатываются"""
+    if not ack_ids:
+        return 0
+    return await _touch_script(keys=[JOIN_STREAM], args=[JOIN_STREAM_GROUP, CONSUMER_NAME, *ack_ids])
+
+
+async def _dequeue_list_batch(max_items: int, timeout: float, linger: float) -> JoinBatch:
+    """
+    Забирает до max_items событий одним скриптом, по кругу из очередей ботов.
+    Если очереди пусты — ждём сигнала о новой активной очереди не дольше timeout.
+    """
+    raw_items, depth = await _pop_round_robin(max_items)
+    if not raw_items:
+        wakeups = [_make_partition_key(JOIN_WAKEUP, p) for p in JOIN_WORKER_PARTITIONS]
+        if not await redis_raw.blpop(wakeups, timeout=timeout):
+            return JoinBatch()
+        raw_items, depth = await _pop_round_robin(max_items)
+
+    if linger and raw_items and len(raw_items) < max_items:
+        await asyncio.sleep(linger)
+        rest, depth = await _pop_round_robin(max_items - len(raw_items))
+        raw_items.extend(rest)
+
+    payloads = [p for p in map(_decode, raw_items) if p is not None]
+    return JoinBatch(payloads=payloads, depth=depth)
+
+
+async def _pop_round_robin(max_items: int) -> tuple[list[bytes], int]:
+    rings = [_make_partition_key(JOIN_ACTIVE_BOTS, p) for p in JOIN_WORKER_PARTITIONS]
+    items, depth = await _pop_round_robin_script(
+        keys=[JOIN_BOT_WEIGHTS, JOIN_QUEUE, *rings],
+        # Легаси-список дочитывает владелец партиции 0
+        args=[max_items, JOIN_BOT_QUANTUM, JOIN_BOT_QUEUE_PREFIX, int(0 in JOIN_WORKER_PARTITIONS)],
+    )
+    return items, depth
+
+
+async def _dequeue_stream_batch(max_items: int, timeout: float, linger: float) -> JoinBatch:
+    global _last_claim_time
+
+    # Периодически забираем себе события, зависшие у упавших реплик
+    if time.time() - _last_claim_time >= JOIN_STREAM_CLAIM_INTERVAL:
+        _last_claim_time = time.time()
+        batch = await _claim_stale_events(max_items)
+        if batch.ack_ids:
+            return batch
+
+    batch = JoinBatch()
+    try:
+        await _read_stream(batch, max_items, block=int(timeout * 1000))
+        if linger and batch.ack_ids and len(batch.ack_ids) < max_items:
+            await asyncio.sleep(linger)
+            await _read_stream(batch, max_items - len(batch.ack_ids))
+    except ResponseError as e:
+        if "NOGROUP" not in str(e):
+            raise
+        await _ensure_stream_group()
+
+    # Полный батч — в стриме может быть ещё; lag группы есть только в Redis 7+
+    if len(batch.ack_ids) >= max_items:
+        batch.depth = await _stream_lag()
+        return batch
+
+    # Добираем из списков ботов: туда пишут гритеры, запущенные с backend=list.
+    # Подтверждать такие события не нужно — LPOP уже забрал их из очереди
+    raw_items, _ = await _pop_round_robin(max_items - len(batch.ack_ids))
+    batch.payloads.extend(p for p in map(_decode, raw_items) if p is not None)
+    return batch
+
+
+async def _read_stream(batch: JoinBatch, count: int, block: int | None = None):
+    response = await redis_raw.xreadgroup(
+        JOIN_STREAM_GROUP,
+        CONSUMER_NAME,
+        {JOIN_STREAM: ">"},
+        count=count,
+        block=block,
+    )
+    for _, entries in response or []:
+        _add_entries(batch, entries)
+
+
+async def _stream_lag() -> int | None:
+    for group in await redis_raw.xinfo_groups(JOIN_STREAM):
+        if group["name"] in (JOIN_STREAM_GROUP, JOIN_STREAM_GROUP.encode()):
+            return group.get("lag")
+    return None
+
+
+async def _claim_stale_events(max_items: int) -> JoinBatch:
+    _, entries, *_ = await redis_raw.xautoclaim(
+        JOIN_STREAM,
+        JOIN_STREAM_GROUP,
+        CONSUMER_NAME,
+        min_idle_time=JOIN_STREAM_CLAIM_IDLE_MS,
+        start_id="0-0",
+        count=max_items,
+    )
+    entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+    if not entries:
+        return JoinBatch()
+
+    # Отсекаем события, которые уже несколько раз роняли обработку
+    pending = await redis_raw.xpending_range(
+        JOIN_STREAM,
+        JOIN_STREAM_GROUP,
+        min=entries[0][0],
+        max=entries[-1][0],
+        count=len(entries),
+        consumername=CONSUMER_NAME,
+    )
+    deliveries = {p["message_id"]: p["times_delivered"] for p in pending}
+
+    # Глубину очереди по перехваченным событиям не знаем
+    batch = JoinBatch(depth=None)
+    dead = []
+    for entry_id, fields in entries:
+        if deliveries.get(entry_id, 0) > JOIN_STREAM_MAX_DELIVERIES:
+            dead.append((entry_id, fields))
+        else:
+            _add_entries(batch, [(entry_id, fields)])
+
+    if dead:
+        pipe = redis_raw.pipeline()
+        pipe.rpush(JOIN_DEAD_LETTER_QUEUE, *[fields.get(b"data", b"") for _, fields in dead])
+        pipe.xack(JOIN_STREAM, JOIN_STREAM_GROUP, *[entry_id for entry_id, _ in dead])
+        await pipe.execute()
+        logger.warning(f"☠️ Moved {len(dead)} join events to {JOIN_DEAD_LETTER_QUEUE}")
+
+    if batch.ack_ids:
+        logger.info(f"♻️ Claimed {len(batch.ack_ids)} stale join events")
+    return batch
+
+
+def _add_entries(batch: JoinBatch, entries):
+    for entry_id, fields in entries:
+        # Битые записи тоже подтверждаем, чтобы они не крутились вечно
+        batch.ack_ids.append(entry_id)
+        payload = _decode(fields.get(b"data", b""))
+        if payload is not None:
+            batch.payloads.append(payload)
@@ -0,0 +1,135 @@
+# app/redis_queue/rate_limiter.py
+
+import asyncio
+import math
+
+from redis.exceptions import RedisError
+
+from app.redis_queue.connection import redis
+from app.utils.logger import logger
+
+# Token bucket в Redis, общий для всех реплик воркеров.
+# Скрипт резервирует токен даже если его ещё нет (tokens уходит в минус) и
+# возвращает, сколько миллисекунд нужно подождать до своей очереди. Так каждый
+# вызов стоит один запрос в Redis, а ожидающие отправки выстраиваются ровно по rate.
+# Часы берём из Redis (TIME), чтобы у реплик не было расхождения.
+# Несколько bucket'ов (например, токен бота и общий потолок) резервируются
+# атомарно одним вызовом: ждём самый медленный из них.
+# Пауза (FloodWait) — это ts в будущем: пока она идёт, токен не резервируется,
+# а скрипт возвращает, сколько ещё ждать. После паузы bucket наполняется с нуля,
+# то есть отправки возобновляются ровно по rate, без всплеска.
+# KEYS: [bucket1, bucket2, ...]
+# ARGV: [rate1, burst1, rate2, burst2, ...]
+# Возвращает {ожидание своего токена мс, оставшаяся пауза мс}
+_reserve_script = redis.register_script(
+    """
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+    local paused = 0
+    for _, key in ipairs(KEYS) do
+        local ts = tonumber(redis.call('HGET', key, 'ts'))
+        if ts and ts > now then
+            paused = math.max(paused, ts - now)
+        end
+    end
+    if paused > 0 then
+        return {0, paused}
+    end
+
+    local result = 0
+    for i, key in ipairs(KEYS) do
+        local rate = tonumber(ARGV[i * 2 - 1])
+        local burst = tonumber(ARGV[i * 2])
+
+        local data = redis.call('HMGET', key, 'tokens', 'ts')
+        local tokens = tonumber(data[1]) or burst
+        local ts = tonumber(data[2]) or now
+
+        if now > ts then
+            tokens = math.min(burst, tokens + (now - ts) * rate / 1000)
+            ts = now
+        end
+
+        tokens = tokens - 1
+        redis.call('HSET', key, 'tokens', tokens, 'ts', ts)
+
+        local wait = 0
+        if tokens < 0 then
+            wait = math.ceil(-tokens * 1000 / rate)
+        end
+        redis.call('PEXPIRE', key, wait + math.ceil(burst * 1000 / rate) + 1000)
+        result = math.max(result, wait)
+    end
+    return {result, 0}
+    """
+)
+
+# Приостанавливает bucket до now + ARGV[1] мс (более длинную паузу не сокращает)
+# KEYS: [bucket]
+# ARGV: [пауза мс]
+_pause_script = redis.register_script(
+    """
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+    local deadline = now + tonumber(ARGV[1])
+
+    local ts = tonumber(redis.call('HGET', KEYS[1], 'ts'))
+    if ts and ts > deadline then
+        deadline = ts
+    end
+
+    redis.call('HSET', KEYS[1], 'tokens', 0, 'ts', deadline)
+    redis.call('PEXPIRE', KEYS[1], deadline - now + 60000)
+    return deadline - now
+    """
+)
+
+
+def _make_key(name: str) -> str:
+    return f"rate_limit:{name}"
+
+
+async def acquire(name: str, rate: float, burst: int):
+    """
+    Ждёт своей очереди в bucket'е name (rate токенов в секунду, не больше burst подряд).
+    Если Redis недоступен — пропускаем без ограничения, чтобы не терять отправки.
+    """
+    await acquire_many([(name, rate, burst)])
+
+
+async def acquire_many(limits: list[tuple[str, float, int]]):
+    """То же для нескольких bucket'ов сразу: [(name, rate, burst), ...]"""
+    while True:
+        wait, paused = await reserve(limits)
+        if paused:
+            await asyncio.sleep(paused)
+            continue
+        if wait:
+            await asyncio.sleep(wait)
+        return
+
+
+async def reserve(limits: list[tuple[str, float, int]]) -> tuple[float, float]:
+    """
+    Резервирует токен без ожидания. Возвращает (через сколько секунд можно
+    отправлять, на сколько секунд ещё приостановлен bucket). При паузе токен
+    не резервируется — нужно подождать и вызвать ещё раз.
+    """
+    keys = [_make_key(name) for name, _, _ in limits]
+    args = [value for _, rate, burst in limits for value in (rate, burst)]
+    try:
+        wait_ms, paused_ms = await _reserve_script(keys=keys, args=args)
+    except RedisError as e:
+        logger.warning(f"⚠️ Rate limiter unavailable for {', '.join(name for name, _, _ in limits)}: {e}")
+        return 0, 0
+
+    return wait_ms / 1000, paused_ms / 1000
+
+
+async def pause(name: str, seconds: float):
+    """Останавливает bucket name для всех реплик (например, по FloodWait от Telegram)"""
+    try:
+        await _pause_script(keys=[_make_key(name)], args=[math.ceil(seconds * 1000)])
+    except RedisError as e:
+        logger.warning(f"⚠️ Failed to pause rate limiter {name}: {e}")
@@ -0,0 +1,123 @@
+# app/redis_queue/worker_registry.py
+
+import asyncio
+import os
+import socket
+import uuid
+from typing import Callable
+
+from redis.exceptions import RedisError
+
+from app.redis_queue.connection import redis
+from app.utils.logger import logger
+
+# Реестр живых воркеров. Каждый процесс регистрируется под своим id и продлевает
+# аренду раз в WORKER_RENEW_INTERVAL. Если процесс умер, аренда истекает сама.
+#   workers          — ZSET: id -> время окончания аренды (мс, часы Redis)
+#   worker:{id}      — HASH: вид воркера, хост, pid и его текущая нагрузка
+WORKERS_KEY = "workers"
+WORKER_KEY_PREFIX = "worker:"
+WORKER_LEASE_TTL = int(os.getenv("WORKER_LEASE_TTL", 30))  # seconds
+WORKER_RENEW_INTERVAL = int(os.getenv("WORKER_RENEW_INTERVAL", 10))  # seconds
+
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+# KEYS: [workers, worker:{id}]
+# ARGV: [id, ttl мс, поле1, значение1, ...]
+_renew_script = redis.register_script(
+    """
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+    local ttl = tonumber(ARGV[2])
+
+    redis.call('ZADD', KEYS[1], now + ttl, ARGV[1])
+    redis.call('HSET', KEYS[2], 'renewed_at', now, unpack(ARGV, 3))
+    redis.call('PEXPIRE', KEYS[2], ttl)
+    return now
+    """
+)
+
+# Весь флот одним запросом: чистим истёкшие аренды и отдаём [id, HGETALL, ...]
+# KEYS: [workers]
+# ARGV: [префикс ключей воркеров]
+_fleet_script = redis.register_script(
+    """
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+    local result = {}
+    for _, id in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+        result[#result + 1] = id
+        result[#result + 1] = redis.call('HGETALL', ARGV[1] .. id)
+    end
+    return result
+    """
+)
+
+
+def _make_key(instance_id: str) -> str:
+    return f"{WORKER_KEY_PREFIX}{instance_id}"
+
+
+async def renew_lease(kind: str, stats: dict | None = None, instance_id: str = INSTANCE_ID):
+    fields = {
+        "kind": kind,
+        "host": socket.gethostname(),
+        "pid": os.getpid(),
+        **(stats or {}),
+    }
+    args = [instance_id, WORKER_LEASE_TTL * 1000]
+    for name, value in fields.items():
+        args.extend([name, "" if value is None else value])
+
+    await _renew_script(keys=[WORKERS_KEY, _make_key(instance_id)], args=args)
+
+
+async def release_lease(instance_id: str = INSTANCE_ID):
+    pipe = redis.pipeline()
+    pipe.zrem(WORKERS_KEY, instance_id)
+    pipe.delete(_make_key(instance_id))
+    await pipe.execute()
+
+
+async def keep_lease(kind: str, stats: Callable[[], dict] | None = None):
+    """
+    Фоновая задача воркера: держит аренду, пока процесс жив, и публикует
+    его нагрузку (stats() — лаг очереди, задачи в работе и т.п.).
+    """
+    try:
+        while True:
+            try:
+                await renew_lease(kind, stats() if stats else None)
+            except RedisError as e:
+                logger.warning(f"⚠️ Failed to renew worker lease {INSTANCE_ID}: {e}")
+            await asyncio.sleep(WORKER_RENEW_INTERVAL)
+    finally:
+        try:
+            await release_lease()
+        except RedisError:
+            pass
+
+
+async def get_fleet() -> list[dict]:
+    """Все живые воркеры с их нагрузкой"""
+    response = await _fleet_script(keys=[WORKERS_KEY], args=[WORKER_KEY_PREFIX])
+
+    fleet = []
+    for instance_id, fields in zip(response[::2], response[1::2]):
+        info = dict(zip(fields[::2], fields[1::2]))
+        info["id"] = instance_id
+        fleet.append(info)
+    return fleet
+
+
+async def main():
+    for worker in sorted(await get_fleet(), key=lambda w: (w.get("kind", ""), w["id"])):
+        stats = ", ".join(f"{k}={v}" for k, v in worker.items() if k not in ("id", "kind", "host", "pid"))
+        print(f"{worker.get('kind', '?'):<20} {worker['id']:<40} {stats}")
+
+
+if __name__ == "__main__":
+    # python -m app.redis_queue.worker_registry
+    asyncio.run(main())
@@ -2,6 +2,7 @@
 import docker
 
 from app.main_bot.config.config import settings
+from app.redis_queue.join_queue import JOIN_DEDUP_TTL, JOIN_QUEUE_BACKEND, JOIN_QUEUE_PARTITIONS
 from app.utils.logger import logger
 
 
@@ -18,6 +19,10 @@ def create_greeter_service(bot_id: int, token: str):
         f"ALEMBIC_DATABASE_URL={settings.alembic_database_url}",
         f"ADMIN_CHAT_ID={settings.admin_chat_id}",
         f"SUPPORT_USERNAME={settings.support_username}",
+        # Настройки продюсера очереди вступлений должны совпадать с join_worker
+        f"JOIN_QUEUE_BACKEND={JOIN_QUEUE_BACKEND}",
+        f"JOIN_DEDUP_TTL={JOIN_DEDUP_TTL}",
+        f"JOIN_QUEUE_PARTITIONS={JOIN_QUEUE_PARTITIONS}",
         "PYTHONUNBUFFERED=1",
         "PYTHONPATH=/app",
     ]
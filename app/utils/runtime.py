@@ -0,0 +1,114 @@
+# app/utils/runtime.py
+
+import asyncio
+import logging
+import os
+import signal
+import sys
+from typing import Awaitable, Callable
+
+from app.utils.logger import logger
+
+# Общий запуск для main.py, greeter_runner.py и всех воркеров:
+# uvloop (если установлен), логирование, graceful shutdown по SIGTERM/SIGINT.
+LOG_FORMAT = "[%(asctime)s] [%(levelname)s] %(name)s: %(message)s"
+LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Сколько ждём завершения фоновых задач после сигнала
+SHUTDOWN_TIMEOUT = 10  # seconds
+
+_logging_configured = False
+_shutdown_callbacks: list[Callable[[], Awaitable]] = []
+
+
+def configure_logging():
+    """Корневой логгер для библиотек (aiogram, sqlalchemy); вызывается один раз на процесс"""
+    global _logging_configured
+    if _logging_configured:
+        return
+
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+    # У salute_bot свой консольный хендлер — без propagate строки не дублируются
+    logger.propagate = False
+    _logging_configured = True
+
+
+def install_event_loop_policy() -> str:
+    if sys.platform == "win32":
+        return "asyncio"
+    try:
+        import uvloop
+    except ImportError:
+        return "asyncio"
+
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return "uvloop"
+
+
+def on_shutdown(callback: Callable[[], Awaitable]):
+    """Регистрирует корутину, которая выполнится при остановке процесса"""
+    _shutdown_callbacks.append(callback)
+
+
+def run(main: Callable[[], Awaitable], name: str):
+    configure_logging()
+    loop_name = install_event_loop_policy()
+
+    from app.redis_queue.codec import JSON_BACKEND
+
+    logger.info(f"⚙️ {name}: event loop {loop_name}, json {JSON_BACKEND}, pid {os.getpid()}")
+
+    try:
+        asyncio.run(_serve(main, name))
+    except KeyboardInterrupt:
+        pass
+    logger.info(f"👋 {name} stopped")
+
+
+async def _serve(main: Callable[[], Awaitable], name: str):
+    loop = asyncio.get_running_loop()
+    main_task = asyncio.current_task()
+
+    def request_shutdown(sig: signal.Signals):
+        logger.info(f"🛑 {name}: received {sig.name}, shutting down...")
+        main_task.cancel()
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, request_shutdown, sig)
+        except NotImplementedError:
+            # Windows: остаётся KeyboardInterrupt
+            pass
+
+    try:
+        await main()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await _shutdown()
+
+
+async def _shutdown():
+    # Сначала останавливаем фоновые задачи (они ещё могут писать в Redis и базу),
+    # потом закрываем соединения
+    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.wait(tasks, timeout=SHUTDOWN_TIMEOUT)
+
+    for callback in reversed(_shutdown_callbacks):
+        try:
+            await callback()
+        except Exception as e:
+            logger.warning(f"⚠️ Shutdown callback {callback.__qualname__} failed: {e}")
+
+    # Закрываем общие клиенты, если процесс их использовал
+    connection = sys.modules.get("app.redis_queue.connection")
+    if connection:
+        await connection.redis.aclose()
+        await connection.redis_raw.aclose()
+
+    session = sys.modules.get("app.database.base.session")
+    if session:
+        await session.engine.dispose()
@@ -0,0 +1,94 @@
+# benchmarks/fake_bot_api.py
+
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+# Локальный Bot API для нагрузочных тестов: отвечает на любой метод любого токена,
+# с настраиваемой задержкой и долей ответов 429. Одобрения заявок запоминаем,
+# чтобы бенчмарк посчитал задержку от постановки в очередь до approve.
+
+
+class FakeBotAPI:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8081,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        error_rate: float = 0,
+        retry_after: int = 1,
+    ):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+
+        # (chat_id, user_id) -> time.perf_counter() первого одобрения
+        self.approved: dict[tuple[int, int], float] = {}
+        self.calls: dict[str, int] = {}
+        self.rate_limited = 0
+
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        token = request.match_info["token"]
+        data = await request.post()
+
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+
+        if self.error_rate and random.random() < self.error_rate:
+            self.rate_limited += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                },
+                status=429,
+            )
+
+        if method.lower() == "approvechatjoinrequest":
+            key = (int(data["chat_id"]), int(data["user_id"]))
+            self.approved.setdefault(key, time.perf_counter())
+
+        return web.json_response({"ok": True, "result": self._result(method, token, data)})
+
+    @staticmethod
+    def _result(method: str, token: str, data):
+        method = method.lower()
+        if method == "getme":
+            return {"id": int(token.split(":")[0]), "is_bot": True, "first_name": "bench"}
+        if method == "sendmessage":
+            return {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": int(data["chat_id"]), "type": "private"},
+                "text": data.get("text", ""),
+            }
+        return True
@@ -1,11 +1,10 @@
-import asyncio
-
 import docker
 from sqlalchemy import select
 
 from app.database.base.session import async_session
 from app.database.models.bot import Bot as BotModel
 from app.utils.docker_service import create_greeter_service
+from app.utils.runtime import run
 
 
 async def main():
@@ -26,4 +25,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main, "deploy_greeters")
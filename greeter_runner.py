@@ -1,7 +1,7 @@
 # greeter_runner.py
 import os
-import asyncio
 from app.greeter_bots.core.launcher import run_greeter_bot
+from app.utils.runtime import run
 
 
 async def main():
@@ -12,4 +12,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main, "greeter_bot")
@@ -1,6 +1,5 @@
 # main.py
 
-import asyncio
 import logging
 
 from aiogram import Bot, Dispatcher
@@ -20,10 +19,8 @@ from app.main_bot.handlers import (
 )
 from app.main_bot.middlewares.UserMiddleware import UserMiddleware
 from app.utils.logger import add_telegram_log_handler
+from app.utils.runtime import run
 
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s — %(message)s"
-)
 logger = logging.getLogger(__name__)
 
 
@@ -67,7 +64,4 @@ async def main() -> None:
 
 
 if __name__ == "__main__":
-    try:
-        asyncio.run(main())
-    except (KeyboardInterrupt, SystemExit):
-        logger.warning("�� Бот остановлен.")
+    run(main, "main_bot")
@@ -0,0 +1,30 @@
+"""channel updated_at
+
+Revision ID: 3b7c1d2e9a41
+Revises: 0fa27f500892
+Create Date: 2025-05-12 14:21:37.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7c1d2e9a41'
+down_revision: Union[str, None] = '0fa27f500892'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('channels', sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True))
+    op.create_index(op.f('ix_channels_updated_at'), 'channels', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_channels_updated_at'), table_name='channels')
+    op.drop_column('channels', 'updated_at')
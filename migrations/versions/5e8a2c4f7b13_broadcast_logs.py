@@ -0,0 +1,53 @@
+"""broadcast_logs
+
+Revision ID: 5e8a2c4f7b13
+Revises: 3b7c1d2e9a41
+Create Date: 2025-05-20 11:42:08.615930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8a2c4f7b13'
+down_revision: Union[str, None] = '3b7c1d2e9a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблицу мог создать create_all из main.py до этой миграции
+    if sa.inspect(op.get_bind()).has_table('broadcast_logs'):
+        return
+
+    op.create_table('broadcast_logs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('bot_id', sa.Integer(), nullable=False),
+    sa.Column('total_users', sa.Integer(), nullable=False),
+    sa.Column('successful', sa.Integer(), nullable=True),
+    sa.Column('failed', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('message_text', sa.Text(), nullable=False),
+    sa.Column('button_text', sa.Text(), nullable=True),
+    sa.Column('button_url', sa.Text(), nullable=True),
+    sa.Column('channel_ids', sa.JSON(), nullable=True),
+    sa.Column('last_user_id', sa.BigInteger(), nullable=True),
+    sa.Column('progress_chat_id', sa.BigInteger(), nullable=True),
+    sa.Column('progress_message_id', sa.BigInteger(), nullable=True),
+    sa.Column('locked_by', sa.String(), nullable=True),
+    sa.Column('locked_until', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('completed', sa.Boolean(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_broadcast_logs_pending', 'broadcast_logs', ['locked_until'], unique=False, postgresql_where=sa.text('completed IS false'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_broadcast_logs_pending', table_name='broadcast_logs', postgresql_where=sa.text('completed IS false'))
+    op.drop_table('broadcast_logs')
@@ -0,0 +1,129 @@
+# tests/test_approve_scheduler.py
+
+import pytest
+from fakeredis import FakeAsyncRedis
+
+from workers.join_worker.services import approve_scheduler as aps
+from workers.join_worker.services import join_handler as jh
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемые часы: due и лиз считаются от них"""
+    now = [1000.0]
+    monkeypatch.setattr(aps.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def fake_redis(monkeypatch, clock):
+    # Скрипт зарегистрирован на общем клиенте при импорте — перевешиваем на фейковый
+    client = FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(aps, "redis", client)
+    monkeypatch.setattr(aps, "_claim_script", client.register_script(aps._claim_script.script))
+    return client
+
+
+@pytest.mark.asyncio
+async def test_claims_only_due_approvals(fake_redis, clock):
+    await aps.schedule_approve(1, -100, 10, delay=5)
+    await aps.schedule_approve(1, -100, 11, delay=60)
+
+    assert await aps.claim_due_approvals() == []
+
+    clock[0] += 5
+    assert await aps.claim_due_approvals() == ["1:-100:10"]
+
+
+@pytest.mark.asyncio
+async def test_claim_respects_limit(fake_redis, clock):
+    for user_id in range(5):
+        await aps.schedule_approve(1, -100, user_id, delay=0)
+
+    assert len(await aps.claim_due_approvals(limit=3)) == 3
+    assert len(await aps.claim_due_approvals(limit=3)) == 2
+
+
+@pytest.mark.asyncio
+async def test_claimed_approval_is_leased(fake_redis, clock):
+    await aps.schedule_approve(1, -100, 10, delay=0)
+
+    assert await aps.claim_due_approvals() == ["1:-100:10"]
+    # Пока лиз не истёк, другая реплика заявку не видит
+    assert await aps.claim_due_approvals() == []
+
+    # Воркер упал, не выполнив complete_approvals — заявка снова due
+    clock[0] += aps.APPROVE_LEASE
+    assert await aps.claim_due_approvals() == ["1:-100:10"]
+
+
+@pytest.mark.asyncio
+async def test_completed_approval_is_not_reclaimed(fake_redis, clock):
+    await aps.schedule_approve(1, -100, 10, delay=0)
+    members = await aps.claim_due_approvals()
+
+    await aps.complete_approvals(members)
+
+    clock[0] += aps.APPROVE_LEASE
+    assert await aps.claim_due_approvals() == []
+
+
+@pytest.mark.asyncio
+async def test_repeated_request_does_not_postpone_approval(fake_redis, clock):
+    await aps.schedule_approve(1, -100, 10, delay=5)
+    clock[0] += 4
+    await aps.schedule_approve(1, -100, 10, delay=5)
+
+    assert await fake_redis.zcard(aps.APPROVE_SCHEDULE_KEY) == 1
+    clock[0] += 1
+    assert await aps.claim_due_approvals() == ["1:-100:10"]
+
+
+def test_parse_member():
+    assert aps.parse_member(aps._make_member(7, -1001234567890, 42)) == (7, -1001234567890, 42)
+
+
+@pytest.fixture
+def approvals(monkeypatch, fake_redis):
+    """fire_due_approvals без Bot API и базы: боты 1 — в кеше, 2 — есть только в базе, 3 — удалён"""
+    approved = []
+
+    async def try_approve(bot, chat_id, user_id):
+        approved.append((bot, chat_id, user_id))
+
+    async def get_existing_bot_ids(bot_ids):
+        return {bot_id for bot_id in bot_ids if bot_id in (1, 2)}
+
+    monkeypatch.setattr(jh, "get_bot", {1: "bot-1"}.get)
+    monkeypatch.setattr(jh, "get_existing_bot_ids", get_existing_bot_ids)
+    monkeypatch.setattr(jh, "try_approve", try_approve)
+    jh.bots_changed.clear()
+    return approved
+
+
+@pytest.mark.asyncio
+async def test_approvals_of_bot_missing_from_cache_are_retried(fake_redis, clock, approvals):
+    await aps.schedule_approve(1, -100, 10, delay=0)
+    await aps.schedule_approve(2, -200, 20, delay=0)
+    await aps.schedule_approve(3, -300, 30, delay=0)
+
+    assert await jh.fire_due_approvals() == 2
+    assert approvals == [("bot-1", -100, 10)]
+    # Бот 2 есть в базе — кеш отстал: просим перечитать и ждём истечения лиза
+    assert jh.bots_changed.is_set()
+    assert await fake_redis.zrange(aps.APPROVE_SCHEDULE_KEY, 0, -1) == ["2:-200:20"]
+
+    clock[0] += aps.APPROVE_LEASE
+    assert await aps.claim_due_approvals() == ["2:-200:20"]
+
+
+@pytest.mark.asyncio
+async def test_approvals_are_kept_when_bot_check_fails(fake_redis, monkeypatch, approvals):
+    async def unavailable(bot_ids):
+        raise ConnectionError("database is down")
+
+    monkeypatch.setattr(jh, "get_existing_bot_ids", unavailable)
+    await aps.schedule_approve(3, -300, 30, delay=0)
+
+    assert await jh.fire_due_approvals() == 0
+    assert await fake_redis.zcard(aps.APPROVE_SCHEDULE_KEY) == 1
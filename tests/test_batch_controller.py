@@ -0,0 +1,140 @@
+# tests/test_batch_controller.py
+
+import pytest
+
+from workers.join_worker.services import batch_controller as bc
+from workers.join_worker.services.batch_controller import BatchController
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемые часы: интервалы между выборками задаём сами"""
+    now = [1000.0]
+    monkeypatch.setattr(bc.time, "monotonic", lambda: now[0])
+    return now
+
+
+def make_controller(initial_size: int = 200) -> BatchController:
+    return BatchController(initial_size, min_size=50, max_size=2000, target_latency=0.5)
+
+
+def test_initial_size_is_clamped():
+    assert make_controller(10).batch_size == 50
+    assert make_controller(10_000).batch_size == 2000
+
+
+def test_grows_under_backlog(clock):
+    controller = make_controller()
+
+    sizes = []
+    for _ in range(5):
+        clock[0] += 0.05
+        controller.on_dequeue(controller.batch_size, depth=100_000)
+        controller.on_processed(controller.batch_size, latency=0.05)
+        sizes.append(controller.batch_size)
+
+    assert sizes == sorted(sizes)
+    assert sizes[-1] > 200
+
+
+def test_growth_is_capped_by_depth_and_max(clock):
+    controller = make_controller()
+
+    clock[0] += 0.05
+    controller.on_dequeue(200, depth=30)
+    controller.on_processed(200, latency=0.05)
+    # Не больше, чем реально осталось в очереди
+    assert controller.batch_size == 230
+
+    for _ in range(30):
+        clock[0] += 0.05
+        controller.on_dequeue(controller.batch_size, depth=100_000)
+        controller.on_processed(controller.batch_size, latency=0.05)
+    assert controller.batch_size == 2000
+
+
+def test_does_not_grow_without_backlog(clock):
+    controller = make_controller()
+
+    clock[0] += 1
+    controller.on_dequeue(10, depth=0)
+    controller.on_processed(10, latency=0.01)
+
+    assert controller.batch_size == 200
+
+
+def test_shrinks_when_slo_is_breached(clock):
+    controller = make_controller(1000)
+
+    sizes = []
+    for _ in range(20):
+        clock[0] += 0.05
+        controller.on_dequeue(controller.batch_size, depth=100_000)
+        controller.on_processed(controller.batch_size, latency=2.0)
+        sizes.append(controller.batch_size)
+
+    assert sizes[0] < 1000
+    assert sizes == sorted(sizes, reverse=True)
+    assert sizes[-1] == 50
+
+
+def test_latency_is_smoothed(clock):
+    controller = make_controller()
+
+    # Один выброс чуть выше SLO после быстрых батчей не режет размер
+    for _ in range(5):
+        controller.on_processed(100, latency=0.1)
+    controller.on_processed(100, latency=0.6)
+
+    assert controller.latency < controller.target_latency
+    assert controller.batch_size == 200
+
+
+def test_empty_batch_is_ignored(clock):
+    controller = make_controller()
+
+    controller.on_processed(0, latency=10)
+
+    assert controller.latency == 0
+    assert controller.batch_size == 200
+
+
+def test_no_linger_when_queue_is_deep(clock):
+    controller = make_controller(50)
+
+    clock[0] += 0.01
+    controller.on_dequeue(50, depth=5000)
+
+    assert controller.arrival_rate > 0
+    assert controller.linger == 0
+
+
+def test_linger_when_batch_fills_quickly(clock):
+    controller = make_controller(50)
+
+    # Поток 100 событий за 10 мс, очередь пуста: батч наберётся за доли SLO
+    clock[0] += 0.01
+    controller.on_dequeue(100, depth=0)
+
+    assert 0 < controller.linger <= controller.target_latency * bc.LINGER_SHARE
+    assert controller.linger == pytest.approx(controller.batch_size / controller.arrival_rate)
+
+
+def test_no_linger_for_slow_traffic(clock):
+    controller = make_controller(50)
+
+    # 1 событие в секунду — ждать наполнения батча дольше SLO
+    clock[0] += 1
+    controller.on_dequeue(1, depth=0)
+
+    assert controller.linger == 0
+
+
+def test_unknown_depth_with_full_batch_counts_as_backlog(clock):
+    controller = make_controller()
+
+    clock[0] += 0.05
+    controller.on_dequeue(200, depth=None)
+
+    assert controller.depth == 200
+    assert controller.linger == 0
@@ -0,0 +1,107 @@
+# tests/test_broadcast_queue.py
+
+import pytest
+from fakeredis import FakeAsyncRedis
+
+from app.redis_queue import broadcast as q
+from app.redis_queue.codec import encode_message
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    # Скрипты зарегистрированы на общем клиенте при импорте — перевешиваем на фейковый
+    client = FakeAsyncRedis()
+    monkeypatch.setattr(q, "redis_raw", client)
+    for name in ("_enqueue_script", "_pop_script"):
+        monkeypatch.setattr(q, name, client.register_script(getattr(q, name).script))
+    return client
+
+
+async def enqueue(bot_id: int, text: str):
+    await q.enqueue_broadcast_task(bot_id, text, channel_ids=[1], total=10)
+
+
+async def ready_bots(client) -> list[bytes]:
+    return await client.zrange(q.BROADCAST_READY, 0, -1)
+
+
+@pytest.mark.asyncio
+async def test_enqueue_marks_bot_ready_once(fake_redis):
+    await enqueue(1, "first")
+    score = await fake_redis.zscore(q.BROADCAST_READY, "1")
+    await enqueue(1, "second")
+
+    assert await ready_bots(fake_redis) == [b"1"]
+    # NX: вторая задача не сдвигает бота в конец
+    assert await fake_redis.zscore(q.BROADCAST_READY, "1") == score
+    assert await fake_redis.llen(q._make_queue(1)) == 2
+
+
+@pytest.mark.asyncio
+async def test_pop_takes_tasks_in_order_and_rotates_bots(fake_redis):
+    await enqueue(1, "a1")
+    await enqueue(1, "a2")
+    await enqueue(2, "b1")
+
+    texts = []
+    while (task := await q.dequeue_broadcast_task(timeout=0.1)) is not None:
+        texts.append(task["text"])
+
+    # Бот 1 с оставшейся задачей встаёт за ботом 2
+    assert texts == ["a1", "b1", "a2"]
+
+
+@pytest.mark.asyncio
+async def test_bot_stays_ready_while_queue_is_not_empty(fake_redis):
+    await enqueue(1, "a1")
+    await enqueue(1, "a2")
+
+    await q.dequeue_broadcast_task(timeout=0.1)
+    assert await ready_bots(fake_redis) == [b"1"]
+
+    await q.dequeue_broadcast_task(timeout=0.1)
+    assert await ready_bots(fake_redis) == []
+    assert await fake_redis.exists(q._make_queue(1)) == 0
+
+
+@pytest.mark.asyncio
+async def test_empty_ready_times_out(fake_redis):
+    assert await q.dequeue_broadcast_task(timeout=0.1) is None
+
+
+@pytest.mark.asyncio
+async def test_malformed_task_is_skipped(fake_redis):
+    await fake_redis.rpush(q._make_queue(1), b"\xff\xfe")
+    await fake_redis.zadd(q.BROADCAST_READY, {"1": 0})
+
+    assert await q.dequeue_broadcast_task(timeout=0.1) is None
+    assert await fake_redis.exists(q._make_queue(1)) == 0
+
+
+@pytest.mark.asyncio
+async def test_register_pending_queues_recovers_stranded_queue(fake_redis):
+    await enqueue(1, "a1")
+    await enqueue(1, "a2")
+    # Воркер снял бота BZPOPMIN и упал до _pop_script
+    await fake_redis.bzpopmin(q.BROADCAST_READY, timeout=0.1)
+    assert await q.dequeue_broadcast_task(timeout=0.1) is None
+
+    assert await q.register_pending_queues() == 1
+
+    task = await q.dequeue_broadcast_task(timeout=0.1)
+    assert task["text"] == "a1"
+
+
+@pytest.mark.asyncio
+async def test_register_pending_queues_picks_up_legacy_queues(fake_redis):
+    await fake_redis.rpush(q._make_queue(3), encode_message({"bot_id": 3, "text": "legacy"}))
+    await fake_redis.rpush(f"{q.BROADCAST_QUEUE_PREFIX}not-a-bot", b"x")
+    await enqueue(1, "a1")
+
+    # Бот 1 уже в ready — повторно не считается
+    assert await q.register_pending_queues() == 1
+    assert await q.register_pending_queues() == 0
+
+    # Легаси-очередь со счётом 0 идёт первой
+    task = await q.dequeue_broadcast_task(timeout=0.1)
+    assert task["text"] == "legacy"
@@ -0,0 +1,73 @@
+# tests/test_codec.py
+
+import json
+
+import msgpack
+import pytest
+
+from app.redis_queue.codec import (
+    TAG_JOIN_EVENT_V1,
+    TAG_MSGPACK_V1,
+    decode_join_event,
+    decode_message,
+    encode_join_event,
+    encode_message,
+)
+
+
+def test_join_event_round_trip():
+    data = encode_join_event(123, -1001234567890, 7)
+
+    assert data[0] == TAG_JOIN_EVENT_V1
+    assert len(data) == 25
+    assert decode_join_event(data) == {"user_id": 123, "chat_id": -1001234567890, "bot_id": 7}
+
+
+def test_join_event_reads_tagged_msgpack():
+    data = encode_message({"user_id": 1, "chat_id": 2, "bot_id": 3})
+
+    assert data[0] == TAG_MSGPACK_V1
+    assert decode_join_event(data) == {"user_id": 1, "chat_id": 2, "bot_id": 3}
+
+
+@pytest.mark.parametrize("data", [
+    json.dumps({"user_id": 1, "chat_id": 2, "bot_id": 3}),
+    json.dumps({"user_id": 1, "chat_id": 2, "bot_id": 3}).encode(),
+])
+def test_join_event_reads_legacy_json(data):
+    # Старые продюсеры писали json.dumps; redis-клиент отдаёт str или bytes
+    assert decode_join_event(data) == {"user_id": 1, "chat_id": 2, "bot_id": 3}
+
+
+def test_message_round_trip():
+    message = {"bot_id": 1, "text": "Привет", "channel_ids": [1, 2], "button_url": None}
+
+    assert decode_message(encode_message(message)) == message
+
+
+@pytest.mark.parametrize("data", [
+    json.dumps({"bot_id": 1, "text": "Привет"}),
+    json.dumps({"bot_id": 1, "text": "Привет"}).encode(),
+])
+def test_message_reads_legacy_json(data):
+    assert decode_message(data) == {"bot_id": 1, "text": "Привет"}
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    "",
+    None,
+    encode_join_event(1, 2, 3)[:-1],  # обрезанное событие
+    bytes([TAG_MSGPACK_V1]) + msgpack.packb({"a": 1})[:-1],  # обрезанный msgpack
+    b"not json",
+    "{broken",
+])
+def test_join_event_rejects_malformed(data):
+    with pytest.raises(ValueError):
+        decode_join_event(data)
+
+
+@pytest.mark.parametrize("data", [b"", "", bytes([TAG_MSGPACK_V1]), b"\xff\xfe", "{broken"])
+def test_message_rejects_malformed(data):
+    with pytest.raises(ValueError):
+        decode_message(data)
@@ -0,0 +1,117 @@
+# tests/test_join_queue.py
+
+from collections import Counter
+
+import pytest
+from fakeredis import FakeAsyncRedis
+
+from app.redis_queue import join_queue as q
+from app.redis_queue.codec import encode_join_event
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """
+    Lua-скрипты очереди на fakeredis (нужен lupa). Скрипты регистрируются
+    при импорте на общем клиенте, поэтому перевешиваем их на фейковый.
+    """
+    client = FakeAsyncRedis()
+    monkeypatch.setattr(q, "redis_raw", client)
+    for name in ("_enqueue_script", "_pop_round_robin_script"):
+        monkeypatch.setattr(q, name, client.register_script(getattr(q, name).script))
+
+    monkeypatch.setattr(q, "JOIN_QUEUE_BACKEND", "list")
+    monkeypatch.setattr(q, "JOIN_QUEUE_PARTITIONS", 1)
+    monkeypatch.setattr(q, "JOIN_WORKER_PARTITIONS", [0])
+    monkeypatch.setattr(q, "JOIN_BOT_QUANTUM", 2)
+    monkeypatch.setattr(q, "JOIN_DEDUP_TTL", 300)
+    return client
+
+
+async def enqueue_many(bot_id: int, count: int, kind: str = q.JOIN_REQUEST):
+    for user_id in range(count):
+        await q.enqueue_join_event(user_id, -100, bot_id, kind)
+
+
+@pytest.mark.asyncio
+async def test_round_robin_gives_each_bot_a_quantum(fake_redis):
+    await enqueue_many(1, 100)
+    await enqueue_many(2, 4)
+
+    batch = await q.dequeue_join_batch(8, timeout=0.1)
+
+    # Всплеск у бота 1 не задерживает бота 2: по кванту (2) по кругу
+    assert [p["bot_id"] for p in batch.payloads] == [1, 1, 2, 2, 1, 1, 2, 2]
+    assert batch.depth == 100 - 4
+
+
+@pytest.mark.asyncio
+async def test_weight_multiplies_quantum(fake_redis):
+    await fake_redis.hset(q.JOIN_BOT_WEIGHTS, "1", 2)
+    await enqueue_many(1, 100)
+    await enqueue_many(2, 100)
+
+    batch = await q.dequeue_join_batch(12, timeout=0.1)
+
+    assert Counter(p["bot_id"] for p in batch.payloads) == {1: 8, 2: 4}
+
+
+@pytest.mark.asyncio
+async def test_drained_bot_leaves_the_ring(fake_redis):
+    await enqueue_many(1, 10)
+    await enqueue_many(2, 1)
+    assert await fake_redis.lrange(q.JOIN_ACTIVE_BOTS, 0, -1) == [b"1", b"2"]
+
+    await q.dequeue_join_batch(4, timeout=0.1)
+    assert await fake_redis.lrange(q.JOIN_ACTIVE_BOTS, 0, -1) == [b"1"]
+
+    batch = await q.dequeue_join_batch(100, timeout=0.1)
+    assert len(batch.payloads) == 10 - 3
+    assert batch.depth == 0
+    assert await fake_redis.llen(q.JOIN_ACTIVE_BOTS) == 0
+
+    # Новое событие возвращает бота в круг
+    await q.enqueue_join_event(42, -100, 2)
+    assert await fake_redis.lrange(q.JOIN_ACTIVE_BOTS, 0, -1) == [b"2"]
+
+
+@pytest.mark.asyncio
+async def test_duplicates_are_suppressed_and_counted(fake_redis):
+    assert await q.enqueue_join_event(1, -100, 7, q.JOIN_REQUEST) is True
+    assert await q.enqueue_join_event(1, -100, 7, q.JOIN_REQUEST) is False
+    # chat_member после одобренной заявки — то же вступление
+    assert await q.enqueue_join_event(1, -100, 7, q.MEMBER_JOINED) is False
+    # Другой пользователь — не дубликат
+    assert await q.enqueue_join_event(2, -100, 7, q.JOIN_REQUEST) is True
+
+    counter = await fake_redis.hgetall(q.JOIN_DEDUP_COUNTER)
+    assert counter == {q.JOIN_REQUEST.encode(): b"1", q.MEMBER_JOINED.encode(): b"1"}
+
+    batch = await q.dequeue_join_batch(10, timeout=0.1)
+    assert [p["user_id"] for p in batch.payloads] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_dedup_disabled_with_zero_ttl(fake_redis, monkeypatch):
+    monkeypatch.setattr(q, "JOIN_DEDUP_TTL", 0)
+
+    assert await q.enqueue_join_event(1, -100, 7) is True
+    assert await q.enqueue_join_event(1, -100, 7) is True
+    assert await fake_redis.llen(q._make_bot_queue(7)) == 2
+
+
+@pytest.mark.asyncio
+async def test_legacy_list_is_read_first(fake_redis):
+    await fake_redis.rpush(q.JOIN_QUEUE, *[encode_join_event(user_id, -100, 9) for user_id in range(3)])
+    await fake_redis.rpush(q.JOIN_QUEUE, b'{"user_id": 3, "chat_id": -100, "bot_id": 9}')
+    await enqueue_many(1, 5)
+
+    batch = await q.dequeue_join_batch(6, timeout=0.1)
+
+    # Легаси получает свой квант первым, дальше — круг ботов
+    assert [(p["bot_id"], p["user_id"]) for p in batch.payloads] == [
+        (9, 0), (9, 1), (1, 0), (1, 1), (1, 2), (1, 3),
+    ]
+
+    batch = await q.dequeue_join_batch(100, timeout=0.1)
+    assert [(p["bot_id"], p["user_id"]) for p in batch.payloads] == [(9, 2), (9, 3), (1, 4)]
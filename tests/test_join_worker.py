@@ -3,7 +3,7 @@
 import pytest
 import json
 from redis.asyncio import Redis
-from workers.join_worker.services.join_handler import handle_join
+from workers.join_worker.services.join_handler import handle_join_batch
 
 
 @pytest.mark.asyncio
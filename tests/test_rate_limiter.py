@@ -0,0 +1,121 @@
+# tests/test_rate_limiter.py
+
+import asyncio
+import time
+
+import pytest
+from fakeredis import FakeAsyncRedis
+from redis.exceptions import RedisError
+
+from app.redis_queue import rate_limiter as rl
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    # Скрипты зарегистрированы на общем клиенте при импорте — перевешиваем на фейковый
+    client = FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(rl, "redis", client)
+    for name in ("_reserve_script", "_pause_script"):
+        monkeypatch.setattr(rl, name, client.register_script(getattr(rl, name).script))
+    return client
+
+
+async def tokens(client, name: str) -> float:
+    return float(await client.hget(rl._make_key(name), "tokens"))
+
+
+@pytest.mark.asyncio
+async def test_burst_then_paced_by_rate(fake_redis):
+    waits = [(await rl.reserve([("bot:1", 10, 3)]))[0] for _ in range(5)]
+
+    assert waits[:3] == [0, 0, 0]
+    # Дальше — в очередь по 1/rate
+    assert waits[3] == pytest.approx(0.1, abs=0.02)
+    assert waits[4] == pytest.approx(0.2, abs=0.02)
+
+
+@pytest.mark.asyncio
+async def test_refill_is_capped_by_burst(fake_redis):
+    for _ in range(2):
+        await rl.reserve([("bot:1", 20, 2)])
+    # За 200 мс при 20/с набежало бы 4 токена, но bucket вмещает только burst
+    await asyncio.sleep(0.2)
+
+    assert (await rl.reserve([("bot:1", 20, 2)]))[0] == 0
+    assert await tokens(fake_redis, "bot:1") == pytest.approx(1, abs=0.1)
+
+
+@pytest.mark.asyncio
+async def test_refill_over_time(fake_redis):
+    for _ in range(3):
+        await rl.reserve([("bot:1", 10, 3)])
+    assert await tokens(fake_redis, "bot:1") == pytest.approx(0, abs=0.1)
+
+    await asyncio.sleep(0.25)
+
+    # ~2 токена за 250 мс при 10/с
+    assert (await rl.reserve([("bot:1", 10, 3)]))[0] == 0
+    assert (await rl.reserve([("bot:1", 10, 3)]))[0] == 0
+    assert (await rl.reserve([("bot:1", 10, 3)]))[0] > 0
+
+
+@pytest.mark.asyncio
+async def test_multi_key_reserve_waits_for_slowest_bucket(fake_redis):
+    limits = [("bot:1", 10, 1), ("broadcast:global", 100, 100)]
+
+    first, _ = await rl.reserve(limits)
+    second, _ = await rl.reserve(limits)
+
+    assert first == 0
+    assert second == pytest.approx(0.1, abs=0.02)
+    # Токен списывается из всех bucket'ов
+    assert await tokens(fake_redis, "bot:1") == pytest.approx(-1, abs=0.1)
+    assert await tokens(fake_redis, "broadcast:global") == pytest.approx(98, abs=0.5)
+
+
+@pytest.mark.asyncio
+async def test_pause_zeroes_tokens_and_blocks_reservations(fake_redis):
+    await rl.reserve([("bot:1", 10, 5)])
+    await rl.pause("bot:1", 0.5)
+    assert await tokens(fake_redis, "bot:1") == 0
+
+    wait, paused = await rl.reserve([("bot:1", 10, 5), ("broadcast:global", 100, 100)])
+
+    assert wait == 0
+    assert paused == pytest.approx(0.5, abs=0.05)
+    # Во время паузы ничего не резервируется — ни в одном bucket'е
+    assert await tokens(fake_redis, "bot:1") == 0
+    assert await fake_redis.exists(rl._make_key("broadcast:global")) == 0
+
+
+@pytest.mark.asyncio
+async def test_shorter_pause_does_not_cut_longer_one(fake_redis):
+    await rl.pause("bot:1", 1)
+    await rl.pause("bot:1", 0.1)
+
+    _, paused = await rl.reserve([("bot:1", 10, 5)])
+
+    assert paused == pytest.approx(1, abs=0.05)
+
+
+@pytest.mark.asyncio
+async def test_acquire_many_waits_until_pause_ends(fake_redis):
+    await rl.pause("bot:1", 0.2)
+
+    started = time.monotonic()
+    await rl.acquire_many([("bot:1", 100, 5)])
+
+    assert time.monotonic() - started >= 0.19
+    # После паузы bucket наполняется с нуля: первый токен — в долг
+    assert await tokens(fake_redis, "bot:1") < 0
+
+
+@pytest.mark.asyncio
+async def test_acquire_fails_open_without_redis(monkeypatch):
+    async def unavailable(*args, **kwargs):
+        raise RedisError("connection refused")
+
+    monkeypatch.setattr(rl, "_reserve_script", unavailable)
+
+    assert await rl.reserve([("bot:1", 10, 1)]) == (0, 0)
+    await asyncio.wait_for(rl.acquire("bot:1", 10, 1), timeout=0.1)
@@ -5,6 +5,9 @@ import docker
 import redis.asyncio as aioredis
 from dotenv import load_dotenv
 
+from app.redis_queue.broadcast import BROADCAST_READY
+from app.utils.runtime import run
+
 load_dotenv(".env")
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
@@ -14,8 +17,9 @@ MAX_WORKERS = 5
 
 
 async def get_queue_length():
+    # Сколько ботов ждут свободного воркера
     redis = await aioredis.from_url(REDIS_URL)
-    length = await redis.llen("broadcast_tasks")
+    length = await redis.zcard(BROADCAST_READY)
     await redis.close()
     return length
 
@@ -52,4 +56,4 @@ async def auto_scale():
 
 
 if __name__ == "__main__":
-    asyncio.run(auto_scale())
+    run(auto_scale, "broadcast_autoscaler")
@@ -1,4 +1,6 @@
 import asyncio
+import os
+import time
 from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
@@ -9,24 +11,73 @@ from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest, Teleg
 from app.database.base.session import async_session
 from app.database.models.channel import Channel
 from app.database.models.member import ChannelMember
+from app.redis_queue.rate_limiter import pause, reserve
 from app.utils.logger import logger
+from workers.broadcast_worker.services.broadcast_jobs import (
+    checkpoint,
+    claim_job,
+    complete_job,
+    create_job,
+    keep_job_lease,
+    release_job,
+    set_progress_message,
+)
 
 DEFAULT_PARSE_MODE = DefaultBotProperties(parse_mode="HTML")
-MAX_CONCURRENT_SENDS = 30
 CHUNK_SIZE = 1000
+
+# Темп отправки задаёт token bucket в Redis, общий для всех реплик:
+# на токен бота (тот же bucket, что у join_worker) и общий потолок рассылок.
+# Небольшой burst — отправки идут ровно, без пачек, которые ловят FloodWait.
+BROADCAST_BOT_RATE = float(os.getenv("BROADCAST_BOT_RATE", 25))  # messages per second
+BROADCAST_BOT_BURST = int(os.getenv("BROADCAST_BOT_BURST", 5))
+BROADCAST_GLOBAL_RATE = float(os.getenv("BROADCAST_GLOBAL_RATE", 500))  # messages per second
+BROADCAST_GLOBAL_BURST = int(os.getenv("BROADCAST_GLOBAL_BURST", 50))
+GLOBAL_BUCKET = "broadcast:global"
+
+# Семафор ограничивает только число отправок в работе в этом процессе
+# (и тем самым — сколько токенов зарезервировано наперёд), а не темп
+MAX_CONCURRENT_SENDS = int(os.getenv("BROADCAST_MAX_CONCURRENT_SENDS", 30))
 semaphore = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+# Сколько ответов FloodWait терпим на одного пользователя. Ожидание паузы бота
+# попыткой не считается — только реальные отказы Telegram
+BROADCAST_SEND_ATTEMPTS = int(os.getenv("BROADCAST_SEND_ATTEMPTS", 5))
+
+# Telegram ID бота -> до какого момента (monotonic) его отправки приостановлены
+_paused_until: dict[int, float] = {}
+# bot_id -> пользователи, заблокировавшие бота, ещё не записанные в базу
+_opt_outs: dict[int, set[int]] = {}
 
 
 async def process_broadcast_task(data: dict):
-    bot_id = data["bot_id"]
-    text = data["text"]
-    user_ids = data["user_ids"]
-    button_text = data.get("button_text")
-    button_url = data.get("button_url")
-    response_chat_id = data.get("response_chat_id")
-    response_message_id = data.get("response_message_id")
+    broadcast_id = data.get("broadcast_id")
+    # Легаси-задачи несут список получателей целиком
+    user_ids = data.get("user_ids")
+    if broadcast_id is None:
+        broadcast_id = await create_job(data)
+
+    await run_broadcast(broadcast_id, data.get("response_message_id"), user_ids)
 
-    logger.info(f"📬 Начало рассылки: bot_id={bot_id}, users={len(user_ids)}")
+
+async def run_broadcast(broadcast_id: int, reply_to_message_id: int = None, user_ids: list[int] = None):
+    """
+    Выполняет задание из broadcast_logs под арендой. После каждой пачки счётчики
+    и курсор сохраняются, поэтому продолжить можно с любого воркера.
+    """
+    job = await claim_job(broadcast_id)
+    if not job:
+        logger.info(f"⏭ Рассылка #{broadcast_id} уже выполняется или завершена")
+        return
+
+    bot_id = job.bot_id
+    sent = job.successful or 0
+    failed = job.failed or 0
+    total = job.total_users or 0
+
+    if job.last_user_id is None:
+        logger.info(f"📬 Начало рассылки #{broadcast_id}: bot_id={bot_id}, users={total}")
+    else:
+        logger.info(f"🔁 Продолжаем рассылку #{broadcast_id}: bot_id={bot_id}, с user_id > {job.last_user_id}")
 
     async with async_session() as session:
         result = await session.execute(
@@ -34,108 +85,232 @@ async def process_broadcast_task(data: dict):
         )
         channel = result.scalar_one_or_none()
 
-        if not channel or not channel.bot:
-            logger.warning(f"⚠️ Bot not found in DB for bot_id={bot_id}")
-            return
+    if not channel or not channel.bot:
+        logger.warning(f"⚠️ Bot not found in DB for bot_id={bot_id}")
+        # Бот удалён — продолжать некому, закрываем задание
+        await complete_job(broadcast_id, sent, failed, total)
+        return
 
-        token = channel.bot.token
+    token = channel.bot.token
+    completed = False
+    lease_task = asyncio.create_task(keep_job_lease(broadcast_id))
 
-    async with Bot(token=token, default=DEFAULT_PARSE_MODE) as bot:
-        kb = None
-        if button_text and button_url:
-            kb = InlineKeyboardMarkup(
-                inline_keyboard=[[InlineKeyboardButton(text=button_text, url=button_url)]]
-            )
-
-        # 🔍 Отбираем только доступных к рассылке
-        filtered_user_ids = user_ids  # Уже отфильтрованы до отправки задачи
-
-        total = len(filtered_user_ids)
-        sent = 0
-        failed = 0
+    try:
+        async with Bot(token=token, default=DEFAULT_PARSE_MODE) as bot:
+            kb = None
+            if job.button_text and job.button_url:
+                kb = InlineKeyboardMarkup(
+                    inline_keyboard=[[InlineKeyboardButton(text=job.button_text, url=job.button_url)]]
+                )
 
-        try:
-            progress_msg = await bot.send_message(
-                chat_id=response_chat_id,
-                text="⏳ Начинаем рассылку...",
-                reply_to_message_id=response_message_id
-            )
-        except Exception as e:
-            logger.warning(f"⚠️ Не удалось отправить сообщение прогресса: {e}")
-            progress_msg = None
-
-        for i in range(0, total, CHUNK_SIZE):
-            chunk = filtered_user_ids[i:i + CHUNK_SIZE]
-
-            tasks = [
-                send_to_user(bot, bot_id, user_id, text, kb)
-                for user_id in chunk
-            ]
-            results = await asyncio.gather(*tasks)
-            sent += sum(1 for r in results if r is True)
-            failed += sum(1 for r in results if r is False)
-
-            # 🔁 Обновление прогресса
-            if progress_msg:
+            progress_chat_id = job.progress_chat_id
+            progress_message_id = job.progress_message_id
+            if progress_chat_id and not progress_message_id:
                 try:
-                    percent = int((sent + failed) / total * 100)
-                    await bot.edit_message_text(
-                        chat_id=progress_msg.chat.id,
-                        message_id=progress_msg.message_id,
-                        text=(
-                            f"📊 <b>Рассылка выполняется...</b>\n\n"
-                            f"✅ Отправлено: <b>{sent}</b>\n"
-                            f"❌ Ошибок: <b>{failed}</b>\n"
-                            f"📦 Всего: <b>{total}</b>\n"
-                            f"📈 Прогресс: <b>{percent}%</b>"
-                        )
+                    progress_msg = await bot.send_message(
+                        chat_id=progress_chat_id,
+                        text="⏳ Начинаем рассылку...",
+                        reply_to_message_id=reply_to_message_id
                     )
-                except TelegramBadRequest as e:
-                    if "message is not modified" not in str(e):
-                        logger.warning(f"⚠️ Ошибка обновления прогресса: {e}")
+                    progress_message_id = progress_msg.message_id
+                    await set_progress_message(broadcast_id, progress_message_id)
+                except Exception as e:
+                    logger.warning(f"⚠️ Не удалось отправить сообщение прогресса: {e}")
 
-        logger.info(f"✅ Рассылка завершена. Успешно: {sent}, Ошибок: {failed}, Всего: {total}")
+            if user_ids is not None:
+                chunks = iter_user_ids(user_ids, job.last_user_id)
+            else:
+                chunks = iter_recipients(bot_id, job.channel_ids, job.last_user_id)
 
-        if progress_msg:
-            try:
-                await bot.edit_message_text(
-                    chat_id=progress_msg.chat.id,
-                    message_id=progress_msg.message_id,
-                    text=(
-                        f"✅ <b>Рассылка завершена.</b>\n\n"
-                        f"✅ Успешно доставлено: <b>{sent}</b>\n"
+            async for chunk in chunks:
+                tasks = [
+                    send_to_user(bot, bot_id, user_id, job.message_text, kb)
+                    for user_id in chunk
+                ]
+                results = await asyncio.gather(*tasks)
+                sent += sum(1 for r in results if r is True)
+                failed += sum(1 for r in results if r is False)
+                # Аудитория читается по ходу рассылки и может подрасти
+                total = max(total, sent + failed)
+
+                await flush_opt_outs()
+                # 💾 Чекпоинт: после падения продолжим со следующей пачки
+                if lease_task.done() or not await checkpoint(broadcast_id, sent, failed, total, chunk[-1]):
+                    logger.warning(f"⚠️ Рассылка #{broadcast_id} перешла к другому воркеру, останавливаемся")
+                    return
+
+                # 🔁 Обновление прогресса
+                if progress_message_id:
+                    percent = int((sent + failed) / total * 100)
+                    await edit_progress(
+                        bot, progress_chat_id, progress_message_id,
+                        f"📊 <b>Рассылка выполняется...</b>\n\n"
+                        f"✅ Отправлено: <b>{sent}</b>\n"
                         f"❌ Ошибок: <b>{failed}</b>\n"
-                        f"📬 Всего: <b>{total}</b>"
+                        f"📦 Всего: <b>{total}</b>\n"
+                        f"📈 Прогресс: <b>{percent}%</b>"
                     )
+
+            await complete_job(broadcast_id, sent, failed, total)
+            completed = True
+            logger.info(f"✅ Рассылка #{broadcast_id} завершена. Успешно: {sent}, Ошибок: {failed}, Всего: {total}")
+
+            if progress_message_id:
+                await edit_progress(
+                    bot, progress_chat_id, progress_message_id,
+                    f"✅ <b>Рассылка завершена.</b>\n\n"
+                    f"✅ Успешно доставлено: <b>{sent}</b>\n"
+                    f"❌ Ошибок: <b>{failed}</b>\n"
+                    f"📬 Всего: <b>{total}</b>"
                 )
+    finally:
+        lease_task.cancel()
+        await flush_opt_outs()
+        if not completed:
+            # Остановка воркера или ошибка: отдаём задание сразу, его продолжит другой воркер
+            try:
+                await release_job(broadcast_id)
             except Exception as e:
-                logger.warning(f"⚠️ Не удалось финализировать прогресс: {e}")
+                logger.warning(f"⚠️ Не удалось освободить рассылку #{broadcast_id}: {e}")
+
+
+async def edit_progress(bot: Bot, chat_id: int, message_id: int, text: str):
+    try:
+        await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            logger.warning(f"⚠️ Ошибка обновления прогресса: {e}")
+    except Exception as e:
+        logger.warning(f"⚠️ Ошибка обновления прогресса: {e}")
+
+
+async def iter_recipients(bot_id: int, channel_ids: list[int], last_user_id: int = None):
+    """
+    Получатели рассылки пачками по CHUNK_SIZE: keyset по user_id, без OFFSET
+    и без выгрузки всей аудитории в память. last_user_id — курсор из чекпоинта.
+    """
+    while True:
+        query = (
+            select(ChannelMember.user_id)
+            .distinct()
+            .where(
+                ChannelMember.channel_id.in_(channel_ids),
+                ChannelMember.bot_id == bot_id,
+                ChannelMember.is_available_for_broadcast.is_(True),
+            )
+            .order_by(ChannelMember.user_id)
+            .limit(CHUNK_SIZE)
+        )
+        if last_user_id is not None:
+            query = query.where(ChannelMember.user_id > last_user_id)
+
+        async with async_session() as session:
+            user_ids = (await session.execute(query)).scalars().all()
+
+        if not user_ids:
+            return
+        yield user_ids
+        last_user_id = user_ids[-1]
+
+
+async def iter_user_ids(user_ids: list[int], last_user_id: int = None):
+    # Сортируем, чтобы курсор из чекпоинта работал и для легаси-задач
+    user_ids = sorted(user_id for user_id in user_ids if last_user_id is None or user_id > last_user_id)
+    for i in range(0, len(user_ids), CHUNK_SIZE):
+        yield user_ids[i:i + CHUNK_SIZE]
 
 
 async def send_to_user(bot: Bot, bot_id: int, user_id: int, text: str, kb: InlineKeyboardMarkup | None) -> bool:
-    async with semaphore:
-        try:
-            await bot.send_message(chat_id=user_id, text=text, reply_markup=kb)
-            return True
-
-        except TelegramRetryAfter as e:
-            logger.warning(f"⏳ FloodWait: {e.retry_after}s for user {user_id}")
-            await asyncio.sleep(e.retry_after)
-            return await send_to_user(bot, bot_id, user_id, text, kb)
-
-        except (TelegramForbiddenError, TelegramBadRequest) as e:
-            logger.warning(f"❌ Telegram error for user {user_id}: {e}")
-            if any(x in str(e).lower() for x in ["blocked", "forbidden", "deactivated"]):
-                async with async_session() as session:
-                    await session.execute(
-                        update(ChannelMember)
-                        .where(ChannelMember.user_id == user_id, ChannelMember.bot_id == bot_id)
-                        .values(is_available_for_broadcast=False)
-                    )
-                    await session.commit()
-                    logger.info(f"🛑 Пользователь {user_id} исключён из рассылок")
-            return False
+    flood_waits = 0
+    while flood_waits < BROADCAST_SEND_ATTEMPTS:
+        # Пауза бота ждётся вне семафора: остальные рассылки процесса не простаивают
+        await wait_bot_pause(bot)
+
+        async with semaphore:
+            wait, paused = await reserve(_limits(bot))
+            if paused:
+                # Бота приостановила другая реплика
+                _pause_locally(bot, paused)
+                continue
+            if wait:
+                await asyncio.sleep(wait)
+            # Пока ждали свой токен, бот мог поймать FloodWait — не стреляем в него
+            if _paused_until.get(bot.id, 0) > time.monotonic():
+                continue
+
+            try:
+                await bot.send_message(chat_id=user_id, text=text, reply_markup=kb)
+                return True
+
+            except TelegramRetryAfter as e:
+                logger.warning(f"⏳ FloodWait: {e.retry_after}s for bot {bot.id}, pausing its sends")
+                await pause_bot(bot, e.retry_after)
+                flood_waits += 1
+                continue
+
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                logger.warning(f"❌ Telegram error for user {user_id}: {e}")
+                if any(x in str(e).lower() for x in ["blocked", "forbidden", "deactivated"]):
+                    # В базу — одним UPDATE после пачки (flush_opt_outs)
+                    _opt_outs.setdefault(bot_id, set()).add(user_id)
+                return False
+
+            except Exception as e:
+                logger.warning(f"🔥 Unexpected error for user {user_id}: {e}")
+                return False
 
+    logger.warning(f"⚠️ Giving up on user {user_id}: bot {bot.id} is still flood-limited")
+    return False
+
+
+async def flush_opt_outs():
+    """Исключает из рассылок накопленных пользователей: один UPDATE на бота"""
+    pending = dict(_opt_outs)
+    _opt_outs.clear()
+
+    for bot_id, user_ids in pending.items():
+        try:
+            async with async_session() as session:
+                await session.execute(
+                    update(ChannelMember)
+                    .where(ChannelMember.bot_id == bot_id, ChannelMember.user_id.in_(user_ids))
+                    .values(is_available_for_broadcast=False)
+                )
+                await session.commit()
+            logger.info(f"🛑 {len(user_ids)} пользователей исключены из рассылок (bot_id={bot_id})")
         except Exception as e:
-            logger.warning(f"🔥 Unexpected error for user {user_id}: {e}")
-            return False
+            logger.warning(f"⚠️ Failed to save opt-outs for bot_id={bot_id}: {e}")
+            # Вернём в буфер — запишем со следующей пачкой
+            _opt_outs.setdefault(bot_id, set()).update(user_ids)
+
+
+def _limits(bot: Bot) -> list[tuple[str, float, int]]:
+    # Ключ — Telegram ID бота из токена: лимиты Bot API считаются по токену
+    return [
+        (f"bot:{bot.id}", BROADCAST_BOT_RATE, BROADCAST_BOT_BURST),
+        (GLOBAL_BUCKET, BROADCAST_GLOBAL_RATE, BROADCAST_GLOBAL_BURST),
+    ]
+
+
+async def pause_bot(bot: Bot, seconds: float):
+    """
+    FloodWait по токену: останавливаем его отправки во всём процессе сразу и
+    в bucket'е Redis — для остальных реплик и join_worker.
+    """
+    _pause_locally(bot, seconds)
+    await pause(f"bot:{bot.id}", seconds)
+
+
+def _pause_locally(bot: Bot, seconds: float):
+    deadline = time.monotonic() + seconds
+    if deadline > _paused_until.get(bot.id, 0):
+        _paused_until[bot.id] = deadline
+
+
+async def wait_bot_pause(bot: Bot):
+    while True:
+        delay = _paused_until.get(bot.id, 0) - time.monotonic()
+        if delay <= 0:
+            _paused_until.pop(bot.id, None)
+            return
+        await asyncio.sleep(delay)
@@ -0,0 +1,164 @@
+import asyncio
+import os
+from datetime import timedelta
+
+from sqlalchemy import func, or_, select, update
+
+from app.database.base.session import async_session
+from app.database.models.broadcast_log import BroadcastLog
+from app.redis_queue.worker_registry import INSTANCE_ID
+from app.utils.logger import logger
+
+# Рассылка выполняется под арендой: воркер продлевает locked_until, пока жив.
+# Истёкшую аренду забирает любой другой воркер и продолжает с last_user_id.
+# Аренды считаются по часам базы (now()), а не воркера.
+BROADCAST_LEASE_TTL = int(os.getenv("BROADCAST_LEASE_TTL", 120))  # seconds
+BROADCAST_LEASE_RENEW_INTERVAL = BROADCAST_LEASE_TTL / 3
+# Задание, которое ещё ни разу не брали, ждёт свою задачу из Redis столько,
+# прежде чем его подхватит поиск брошенных рассылок
+BROADCAST_RESUME_GRACE = int(os.getenv("BROADCAST_RESUME_GRACE", 600))  # seconds
+
+_lease = timedelta(seconds=BROADCAST_LEASE_TTL)
+
+
+def _owned(broadcast_id: int):
+    return (
+        BroadcastLog.id == broadcast_id,
+        BroadcastLog.locked_by == INSTANCE_ID,
+        BroadcastLog.completed.is_(False),
+    )
+
+
+async def create_job(data: dict) -> int:
+    """Задание для задачи без broadcast_id (от старых продюсеров)"""
+    user_ids = data.get("user_ids")
+    async with async_session() as session:
+        broadcast = BroadcastLog(
+            bot_id=data["bot_id"],
+            total_users=len(user_ids) if user_ids is not None else data.get("total") or 0,
+            message_text=data["text"],
+            button_text=data.get("button_text"),
+            button_url=data.get("button_url"),
+            channel_ids=data.get("channel_ids"),
+            progress_chat_id=data.get("response_chat_id"),
+        )
+        session.add(broadcast)
+        await session.commit()
+        return broadcast.id
+
+
+async def claim_job(broadcast_id: int) -> BroadcastLog | None:
+    """
+    Берёт задание в аренду, если оно не завершено и никто его не держит.
+    Повторная доставка той же задачи ничего не отправит второй раз.
+    """
+    async with async_session() as session:
+        result = await session.execute(
+            update(BroadcastLog)
+            .where(
+                BroadcastLog.id == broadcast_id,
+                BroadcastLog.completed.is_(False),
+                or_(BroadcastLog.locked_until.is_(None), BroadcastLog.locked_until < func.now()),
+            )
+            .values(locked_by=INSTANCE_ID, locked_until=func.now() + _lease)
+            .returning(BroadcastLog)
+        )
+        job = result.scalar_one_or_none()
+        await session.commit()
+        return job
+
+
+async def set_progress_message(broadcast_id: int, message_id: int):
+    async with async_session() as session:
+        await session.execute(
+            update(BroadcastLog).where(*_owned(broadcast_id)).values(progress_message_id=message_id)
+        )
+        await session.commit()
+
+
+async def checkpoint(broadcast_id: int, sent: int, failed: int, total: int, last_user_id: int) -> bool:
+    """
+    Фиксирует пачку и продлевает аренду. False — аренду уже забрал другой воркер,
+    продолжать нельзя.
+    """
+    async with async_session() as session:
+        result = await session.execute(
+            update(BroadcastLog)
+            .where(*_owned(broadcast_id))
+            .values(
+                successful=sent,
+                failed=failed,
+                total_users=total,
+                last_user_id=last_user_id,
+                locked_until=func.now() + _lease,
+            )
+        )
+        await session.commit()
+        return result.rowcount > 0
+
+
+async def renew_job_lease(broadcast_id: int) -> bool:
+    async with async_session() as session:
+        result = await session.execute(
+            update(BroadcastLog).where(*_owned(broadcast_id)).values(locked_until=func.now() + _lease)
+        )
+        await session.commit()
+        return result.rowcount > 0
+
+
+async def keep_job_lease(broadcast_id: int):
+    """
+    Продлевает аренду между чекпоинтами (пачка может идти дольше аренды,
+    например при FloodWait). Завершается, если аренда потеряна.
+    """
+    while True:
+        await asyncio.sleep(BROADCAST_LEASE_RENEW_INTERVAL)
+        try:
+            if not await renew_job_lease(broadcast_id):
+                logger.warning(f"⚠️ Lost lease on broadcast #{broadcast_id}")
+                return
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to renew lease on broadcast #{broadcast_id}: {e}")
+
+
+async def complete_job(broadcast_id: int, sent: int, failed: int, total: int):
+    async with async_session() as session:
+        await session.execute(
+            update(BroadcastLog)
+            .where(*_owned(broadcast_id))
+            .values(successful=sent, failed=failed, total_users=total, completed=True, locked_until=None)
+        )
+        await session.commit()
+
+
+async def release_job(broadcast_id: int):
+    """Отдаёт незавершённое задание сразу, не дожидаясь истечения аренды"""
+    async with async_session() as session:
+        await session.execute(
+            update(BroadcastLog).where(*_owned(broadcast_id)).values(locked_until=func.now())
+        )
+        await session.commit()
+
+
+async def find_abandoned_jobs(limit: int = 100) -> list[int]:
+    """
+    Незавершённые рассылки, чья аренда истекла, и задания, которые так и не
+    взяли из Redis. Легаси-задания без аудитории в базе продолжить нельзя.
+    """
+    async with async_session() as session:
+        result = await session.execute(
+            select(BroadcastLog.id)
+            .where(
+                BroadcastLog.completed.is_(False),
+                BroadcastLog.channel_ids.is_not(None),
+                or_(
+                    BroadcastLog.locked_until < func.now(),
+                    BroadcastLog.locked_until.is_(None)
+                    & (BroadcastLog.created_at < func.now() - timedelta(seconds=BROADCAST_RESUME_GRACE)),
+                ),
+            )
+            .order_by(BroadcastLog.id)
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
@@ -1,36 +1,63 @@
 import asyncio
-import json
-import time
+import os
 
-from app.redis_queue.connection import redis
+from app.redis_queue.broadcast import dequeue_broadcast_task, register_pending_queues
+from app.redis_queue.worker_registry import keep_lease
 from app.utils.logger import logger
-from workers.broadcast_worker.services.broadcast_handler import process_broadcast_task
+from app.utils.runtime import on_shutdown, run
+from workers.broadcast_worker.services.broadcast_handler import flush_opt_outs, process_broadcast_task, run_broadcast
+from workers.broadcast_worker.services.broadcast_jobs import find_abandoned_jobs
 
+DEQUEUE_TIMEOUT = 5  # seconds
+# Как часто ищем рассылки, брошенные упавшими или остановленными воркерами
+BROADCAST_RESUME_INTERVAL = int(os.getenv("BROADCAST_RESUME_INTERVAL", 30))  # seconds
 
-async def heartbeat(name: str):
-    await redis.set(f"worker_status:{name}", int(time.time()))
+# Рассылки в работе: держим ссылки, чтобы задачи не собрал GC, и отдаём их число в реестр
+running_tasks: set[asyncio.Task] = set()
+
+
+def start_broadcast(coro):
+    broadcast = asyncio.create_task(coro)
+    running_tasks.add(broadcast)
+    broadcast.add_done_callback(running_tasks.discard)
+
+
+async def resume_abandoned_broadcasts():
+    """
+    Продолжает рассылки с истёкшей арендой; кто из воркеров возьмёт — решает claim_job.
+    Заодно возвращает в ready очереди, чьего бота снял BZPOPMIN упавшего воркера.
+    """
+    while True:
+        try:
+            await register_pending_queues()
+        except Exception as e:
+            logger.error(f"🔥 Error while registering pending broadcast queues: {e}")
+        try:
+            for broadcast_id in await find_abandoned_jobs():
+                logger.info(f"🔁 Found abandoned broadcast #{broadcast_id}, resuming")
+                start_broadcast(run_broadcast(broadcast_id))
+        except Exception as e:
+            logger.error(f"🔥 Error while resuming broadcasts: {e}")
+        await asyncio.sleep(BROADCAST_RESUME_INTERVAL)
 
 
 async def main():
     logger.info("📡 Universal Broadcast Worker started. Listening for any bot_id...")
 
+    # Отписки, не успевшие уйти в базу с последней пачкой
+    on_shutdown(flush_opt_outs)
+    asyncio.create_task(keep_lease("broadcast_worker", lambda: {"inflight_tasks": len(running_tasks)}))
+    asyncio.create_task(resume_abandoned_broadcasts())
+
     while True:
         try:
-            keys = await redis.keys("broadcast_tasks:*")
-            if not keys:
-                await asyncio.sleep(0.5)
+            # Один блокирующий запрос на все очереди: ждём любого бота с задачами
+            data = await dequeue_broadcast_task(timeout=DEQUEUE_TIMEOUT)
+            if not data:
                 continue
 
-            for queue in keys:
-                task = await redis.blpop(queue)
-                if task:
-                    _, raw_data = task
-                    data = json.loads(raw_data)
-                    logger.info(f"📥 Task from {queue}: {data}")
-                    asyncio.create_task(process_broadcast_task(data))
-
-            # ✅ Пингуем в Redis, чтобы manager знал что мы живы
-            await heartbeat("broadcast_worker:universal")
+            logger.info(f"📥 Task for bot_id={data.get('bot_id')}: {data}")
+            start_broadcast(process_broadcast_task(data))
 
         except Exception as e:
             logger.error(f"🔥 Error in universal broadcast worker: {e}")
@@ -38,4 +65,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main, "broadcast_worker")
@@ -0,0 +1,56 @@
+# workers/join_worker/services/approve_scheduler.py
+
+import os
+import time
+
+from app.redis_queue.connection import redis
+
+# 🔥 Отложенные одобрения храним в sorted set: member = "{bot_id}:{chat_id}:{user_id}", score = время одобрения
+APPROVE_SCHEDULE_KEY = "approve_schedule"
+APPROVE_POLL_INTERVAL = 1  # seconds
+APPROVE_BATCH_SIZE = int(os.getenv("APPROVE_BATCH_SIZE", 100))
+# Сколько секунд заявка принадлежит воркеру, который её забрал.
+# Если воркер упал, не успев одобрить, заявка снова станет "due" после лиза.
+APPROVE_LEASE = 60
+
+# Атомарно забираем due-заявки: сдвигаем их score на время лиза, чтобы другие реплики их не взяли
+_claim_script = redis.register_script(
+    """
+    local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+    for _, item in ipairs(items) do
+        redis.call('ZADD', KEYS[1], ARGV[3], item)
+    end
+    return items
+    """
+)
+
+
+def _make_member(bot_id: int, chat_id: int, user_id: int) -> str:
+    return f"{bot_id}:{chat_id}:{user_id}"
+
+
+async def schedule_approve(bot_id: int, chat_id: int, user_id: int, delay: int):
+    # nx=True — повторная заявка не откладывает уже запланированное одобрение
+    await redis.zadd(
+        APPROVE_SCHEDULE_KEY,
+        {_make_member(bot_id, chat_id, user_id): time.time() + delay},
+        nx=True,
+    )
+
+
+async def claim_due_approvals(limit: int = APPROVE_BATCH_SIZE) -> list[str]:
+    now = time.time()
+    return await _claim_script(
+        keys=[APPROVE_SCHEDULE_KEY],
+        args=[now, limit, now + APPROVE_LEASE],
+    )
+
+
+async def complete_approvals(members: list[str]):
+    if members:
+        await redis.zrem(APPROVE_SCHEDULE_KEY, *members)
+
+
+def parse_member(member: str) -> tuple[int, int, int]:
+    bot_id, chat_id, user_id = member.split(":")
+    return int(bot_id), int(chat_id), int(user_id)
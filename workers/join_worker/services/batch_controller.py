@@ -0,0 +1,88 @@
+# workers/join_worker/services/batch_controller.py
+
+import os
+import time
+
+# Размер батча и время добора подбираются по глубине очереди и целевой задержке:
+# при бэклоге батч растёт (меньше запросов в базу и Redis на событие), пока фаза
+# Redis + база укладывается в половину SLO; если она дольше SLO — батч уменьшается.
+# Отправки в Bot API и ожидание токенов бота сюда не входят: от размера батча они
+# не зависят, и уменьшение батча их бы не сократило.
+# Добор (linger) включается, только когда при текущем потоке батч успеет
+# наполниться быстро — иначе ожидание только добавило бы задержку.
+JOIN_TARGET_LATENCY = float(os.getenv("JOIN_TARGET_LATENCY_MS", 500)) / 1000  # seconds
+JOIN_BATCH_MIN = int(os.getenv("JOIN_BATCH_MIN", 50))
+JOIN_BATCH_MAX = int(os.getenv("JOIN_BATCH_MAX", 2000))
+# Добор — не больше этой доли SLO
+LINGER_SHARE = 0.2
+# Сглаживание наблюдений (EWMA)
+SMOOTHING = 0.3
+
+
+class BatchController:
+    def __init__(
+        self,
+        initial_size: int,
+        min_size: int = JOIN_BATCH_MIN,
+        max_size: int = JOIN_BATCH_MAX,
+        target_latency: float = JOIN_TARGET_LATENCY,
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+
+        self.batch_size = max(min_size, min(max_size, initial_size))
+        self.linger = 0.0
+
+        self.depth = 0
+        self.arrival_rate = 0.0  # events per second
+        self.latency = 0.0  # seconds, фаза Redis + база в handle_join_batch
+
+        self._last_dequeue = time.monotonic()
+
+    def on_dequeue(self, count: int, depth: int | None):
+        now = time.monotonic()
+        interval = now - self._last_dequeue
+        self._last_dequeue = now
+
+        if interval > 0:
+            self.arrival_rate = _smooth(self.arrival_rate, count / interval)
+        # Глубина неизвестна, но батч полный — считаем, что там есть ещё минимум батч
+        if depth is None:
+            depth = self.batch_size if count >= self.batch_size else 0
+        self.depth = depth
+
+        self._update_linger()
+
+    def on_processed(self, count: int, latency: float):
+        if not count:
+            return
+
+        self.latency = _smooth(self.latency, latency)
+        if self.latency > self.target_latency:
+            self.batch_size = max(self.min_size, int(self.batch_size * 0.7))
+        elif self.depth > 0 and self.latency < self.target_latency / 2:
+            self.batch_size = min(self.max_size, int(self.batch_size * 1.5), self.batch_size + self.depth)
+
+        self._update_linger()
+
+    def _update_linger(self):
+        self.linger = 0.0
+        if self.depth == 0 and self.arrival_rate > 0:
+            fill_time = self.batch_size / self.arrival_rate
+            if fill_time <= self.target_latency * LINGER_SHARE:
+                self.linger = fill_time
+
+    def metrics(self) -> dict:
+        return {
+            "batch_size": self.batch_size,
+            "linger_ms": round(self.linger * 1000),
+            "queue_depth": self.depth,
+            "arrival_rate": round(self.arrival_rate, 1),
+            "batch_latency_ms": round(self.latency * 1000),
+            "target_latency_ms": round(self.target_latency * 1000),
+        }
+
+
+def _smooth(current: float, value: float) -> float:
+    return current + SMOOTHING * (value - current)
@@ -1,40 +1,107 @@
 # workers/join_worker/services/bot_cache.py
 
+import asyncio
+import os
+
 from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from sqlalchemy import select
 
 from app.database.base.session import async_session
 from app.database.models.bot import Bot as BotModel
+from app.redis_queue.connection import redis
 from app.utils.logger import logger
 
 DEFAULT_PARSE_MODE = DefaultBotProperties(parse_mode="HTML")
 
+# Свой адрес Bot API: локальный telegram-bot-api сервер или фейковый API из benchmarks/
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# Канал pub/sub, в который главный бот сигналит о добавлении/удалении ботов
+BOT_CACHE_CHANNEL = "bot_cache:changed"
+
 bot_cache = {}
+_bot_tokens: dict[int, str] = {}
+
+# Выставляется при сигнале об изменении ботов — воркер сразу перечитывает кеш
+bots_changed = asyncio.Event()
 
 
 async def init_bot_cache():
-    logger.info("🔄 Initializing bot cache...")
+    """
+    Инкрементальное обновление: создаём Bot только для новых токенов и закрываем
+    сессии только удалённых или сменивших токен ботов. Остальные aiohttp-сессии
+    (и их keep-alive соединения к Bot API) не трогаем.
+    """
+    async with async_session() as session:
+        result = await session.execute(select(BotModel.id, BotModel.token))
+        tokens = {row.id: row.token for row in result.fetchall()}
+
+    stale = [bot_id for bot_id, token in _bot_tokens.items() if tokens.get(bot_id) != token]
+    for bot_id in stale:
+        bot = bot_cache.pop(bot_id, None)
+        _bot_tokens.pop(bot_id, None)
+        if bot:
+            try:
+                await bot.session.close()
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to close bot session: {e}")
+
+    added = 0
+    for bot_id, token in tokens.items():
+        if bot_id not in bot_cache:
+            bot_cache[bot_id] = _make_bot(token)
+            _bot_tokens[bot_id] = token
+            added += 1
+
+    if stale or added:
+        logger.info(f"✅ Bot cache updated: +{added} / -{len(stale)}, total {len(bot_cache)}")
+
+
+def _make_bot(token: str) -> Bot:
+    session = None
+    if TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+    return Bot(token=token, session=session, default=DEFAULT_PARSE_MODE)
+
+
+async def notify_bots_changed():
+    """Сигнал join-воркерам перечитать ботов из базы"""
+    await redis.publish(BOT_CACHE_CHANNEL, "1")
 
-    # Закрываем старые сессии
+
+async def listen_bot_changes():
+    pubsub = redis.pubsub()
+    try:
+        await pubsub.subscribe(BOT_CACHE_CHANNEL)
+        # Пока не были подписаны, могли пропустить сигнал
+        bots_changed.set()
+
+        async for message in pubsub.listen():
+            if message["type"] == "message":
+                bots_changed.set()
+    finally:
+        await pubsub.aclose()
+
+
+async def close_bot_cache():
     for bot in bot_cache.values():
         try:
             await bot.session.close()
         except Exception as e:
             logger.warning(f"⚠️ Failed to close bot session: {e}")
-
     bot_cache.clear()
-
-    async with async_session() as session:
-        result = await session.execute(BotModel.__table__.select())
-        bots = result.fetchall()
-
-        for bot_row in bots:
-            bot_id = bot_row.id
-            bot_token = bot_row.token
-            bot_cache[bot_id] = Bot(token=bot_token, default=DEFAULT_PARSE_MODE)
-
-    logger.info(f"✅ Cached {len(bot_cache)} bots")
+    _bot_tokens.clear()
 
 
 def get_bot(bot_id: int) -> Bot:
     return bot_cache.get(bot_id)
+
+
+async def get_existing_bot_ids(bot_ids: list[int]) -> set[int]:
+    """Какие из ботов есть в базе: удалённого бота отличаем от ещё не попавшего в кеш"""
+    async with async_session() as session:
+        result = await session.execute(select(BotModel.id).where(BotModel.id.in_(bot_ids)))
+        return set(result.scalars().all())
@@ -1,113 +1,266 @@
 import asyncio
-import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
 
 from sqlalchemy import select
 
 from app.database.base.session import async_session
 from app.database.models.channel import Channel
+from app.redis_queue.codec import json_dumps, json_loads
 from app.redis_queue.connection import redis
 from app.utils.logger import logger
 
 
+# Канал pub/sub, в который пишем ключ изменённого канала и его новую версию
+CHANNEL_INVALIDATION_CHANNEL = "channel_cache:invalidate"
+
+# L1 — кеш уже декодированных настроек каналов в памяти воркера
+L1_MAX_SIZE = 10_000
+# Страховка на случай потерянного pub/sub сообщения
+L1_TTL = 60  # seconds
+
+# redis key -> (expires_at, channel_data)
+_l1_cache: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+# redis key -> версия из последней инвалидации; более старые данные в L1 не кладём
+_invalidated_versions: dict[str, int] = {}
+
+# now() в Postgres — время начала транзакции, поэтому строка может закоммититься
+# позже с updated_at меньше watermark. Такие строки ловим, перечитывая окно перекрытия.
+CHANNEL_SYNC_OVERLAP = timedelta(seconds=30)
+
+# Максимальный updated_at среди уже синхронизированных каналов
+_sync_watermark: datetime | None = None
+# redis key -> версия строк из окна перекрытия, уже записанных в Redis
+_recent_versions: dict[str, int] = {}
+
+
 # 🔥 Ключи в Redis будем хранить в виде: channel:{bot_id}:{channel_id}
 def _make_redis_key(channel_id: int, bot_id: int):
     return f"channel:{bot_id}:{channel_id}"
 
 
+def _make_version(updated_at: datetime | None = None) -> int:
+    if updated_at:
+        return int(updated_at.timestamp() * 1000)
+    return time.time_ns() // 1_000_000
+
+
+def _channel_to_dict(row) -> dict:
+    return {
+        "id": row.id,
+        "channel_id": row.channel_id,
+        "channel_name": row.channel_name,
+        "bot_id": row.bot_id,
+        "welcome_enabled": row.welcome_enabled,
+        "welcome_message": row.welcome_message,
+        "has_button": row.has_button,
+        "button_type": row.button_type,
+        "button_text": row.button_text,
+        "button_url": row.button_url,
+        "captcha_enabled": row.captcha_enabled,
+        "captcha_text": row.captcha_text,
+        "captcha_has_button": row.captcha_has_button,
+        "captcha_button_text": row.captcha_button_text,
+        "captcha_only_for_new_users": row.captcha_only_for_new_users,
+        "auto_approve_mode": row.auto_approve_mode,
+        "version": _make_version(row.updated_at),
+    }
+
+
 async def init_channel_cache():
+    """Полная загрузка всех каналов — только при старте воркера"""
+    global _sync_watermark
+
     logger.info("🔄 Initializing channel cache...")
 
     async with async_session() as session:
         result = await session.execute(Channel.__table__.select())
         channels = result.fetchall()
 
-        pipe = redis.pipeline()
-
-        for row in channels:
-            key = _make_redis_key(row.channel_id, row.bot_id)
-            channel_data = {
-                "id": row.id,
-                "channel_id": row.channel_id,
-                "channel_name": row.channel_name,
-                "bot_id": row.bot_id,
-                "welcome_enabled": row.welcome_enabled,
-                "welcome_message": row.welcome_message,
-                "has_button": row.has_button,
-                "button_type": row.button_type,
-                "button_text": row.button_text,
-                "button_url": row.button_url,
-                "captcha_enabled": row.captcha_enabled,
-                "captcha_text": row.captcha_text,
-                "captcha_has_button": row.captcha_has_button,
-                "captcha_button_text": row.captcha_button_text,
-                "captcha_only_for_new_users": row.captcha_only_for_new_users,
-                "auto_approve_mode": row.auto_approve_mode,
-            }
-
-            pipe.set(key, json.dumps(channel_data))
+    pipe = redis.pipeline()
 
-        await pipe.execute()
+    for row in channels:
+        key = _make_redis_key(row.channel_id, row.bot_id)
+        channel_data = _channel_to_dict(row)
+
+        pipe.set(key, json_dumps(channel_data))
+
+    await pipe.execute()
+
+    _sync_watermark = max((row.updated_at for row in channels if row.updated_at), default=datetime.now().astimezone())
+    _remember_recent(channels)
 
     logger.info(f"✅ Cached {len(channels)} channels in Redis")
 
 
+async def sync_channel_cache():
+    """Инкрементальная синхронизация: забираем из базы только каналы, изменённые после watermark"""
+    global _sync_watermark
+
+    if _sync_watermark is None:
+        await init_channel_cache()
+        return
+
+    async with async_session() as session:
+        result = await session.execute(
+            Channel.__table__.select().where(Channel.updated_at > _sync_watermark - CHANNEL_SYNC_OVERLAP)
+        )
+        channels = result.fetchall()
+
+    pipe = redis.pipeline()
+    changed = 0
+
+    for row in channels:
+        key = _make_redis_key(row.channel_id, row.bot_id)
+        channel_data = _channel_to_dict(row)
+        if _recent_versions.get(key) == channel_data["version"]:
+            continue
+
+        pipe.set(key, json_dumps(channel_data))
+        pipe.publish(
+            CHANNEL_INVALIDATION_CHANNEL,
+            json_dumps({"key": key, "version": channel_data["version"]}),
+        )
+        changed += 1
+
+    if changed:
+        await pipe.execute()
+        logger.info(f"🔄 Synced {changed} changed channels to Redis")
+
+    _sync_watermark = max([_sync_watermark] + [row.updated_at for row in channels if row.updated_at])
+    _remember_recent(channels)
+
+
+def _remember_recent(channels):
+    _recent_versions.clear()
+    since = _sync_watermark - CHANNEL_SYNC_OVERLAP
+    for row in channels:
+        if row.updated_at and row.updated_at > since:
+            _recent_versions[_make_redis_key(row.channel_id, row.bot_id)] = _make_version(row.updated_at)
+
+
 async def update_channel_in_cache(channel_id: int, bot_id: int):
     async with async_session() as session:
         result = await session.execute(
-            select(Channel).where(Channel.channel_id == channel_id, Channel.bot_id == bot_id)
+            select(Channel).where(Channel.channel_id == str(channel_id), Channel.bot_id == bot_id)
         )
         channel = result.scalar_one_or_none()
 
-        if channel:
-            key = _make_redis_key(channel_id, bot_id)
-            channel_data = {
-                "id": channel.id,
-                "channel_id": channel.channel_id,
-                "channel_name": channel.channel_name,
-                "bot_id": channel.bot_id,
-                "welcome_enabled": channel.welcome_enabled,
-                "welcome_message": channel.welcome_message,
-                "has_button": channel.has_button,
-                "button_type": channel.button_type,
-                "button_text": channel.button_text,
-                "button_url": channel.button_url,
-                "captcha_enabled": channel.captcha_enabled,
-                "captcha_text": channel.captcha_text,
-                "captcha_has_button": channel.captcha_has_button,
-                "captcha_button_text": channel.captcha_button_text,
-                "captcha_only_for_new_users": channel.captcha_only_for_new_users,
-                "auto_approve_mode": channel.auto_approve_mode,
-            }
-
-            await redis.set(key, json.dumps(channel_data))
-            logger.info(f"🧩 Обновили кеш канала (channel_id={channel_id}, bot_id={bot_id}) в Redis")
+    if channel:
+        await _write_channel(channel)
+
+
+async def refresh_channel_cache(channel_pk: int):
+    """Обновляет кеш канала по первичному ключу channels.id — так его знают хендлеры гритер-бота"""
+    async with async_session() as session:
+        result = await session.execute(select(Channel).where(Channel.id == channel_pk))
+        channel = result.scalar_one_or_none()
+
+    if channel:
+        await _write_channel(channel)
+
+
+async def _write_channel(channel: Channel):
+    key = _make_redis_key(channel.channel_id, channel.bot_id)
+    channel_data = _channel_to_dict(channel)
+
+    pipe = redis.pipeline()
+    pipe.set(key, json_dumps(channel_data))
+    pipe.publish(
+        CHANNEL_INVALIDATION_CHANNEL,
+        json_dumps({"key": key, "version": channel_data["version"]}),
+    )
+    await pipe.execute()
+    logger.info(
+        f"🧩 Обновили кеш канала (channel_id={channel.channel_id}, bot_id={channel.bot_id}) в Redis"
+    )
 
 
 async def get_channel(channel_id: int, bot_id: int):
-    key = _make_redis_key(channel_id, bot_id)
-    data = await redis.get(key)
-    if data:
-        return json.loads(data)
-    logger.warning(f"⚠️ Канал не найден в Redis кеш: {key}")
-    return None
+    channels = await get_channels_bulk([(channel_id, bot_id)])
+    return channels.get((channel_id, bot_id))
 
 
 async def get_channels_bulk(pairs: list[tuple[int, int]]) -> dict:
-    keys = [_make_redis_key(channel_id, bot_id) for channel_id, bot_id in pairs]
+    channels = {}
+    missing = []
+    now = time.monotonic()
+
+    # Сначала L1: без запроса в Redis и без json.loads
+    for channel_id, bot_id in pairs:
+        key = _make_redis_key(channel_id, bot_id)
+        entry = _l1_cache.get(key)
+        if entry and entry[0] > now:
+            _l1_cache.move_to_end(key)
+            channels[(channel_id, bot_id)] = entry[1]
+        else:
+            missing.append((channel_id, bot_id))
+
+    if not missing:
+        return channels
+
+    keys = [_make_redis_key(channel_id, bot_id) for channel_id, bot_id in missing]
     results = await redis.mget(*keys)
 
-    channels = {}
-    for (channel_id, bot_id), data in zip(pairs, results):
+    for (channel_id, bot_id), key, data in zip(missing, keys, results):
         if data:
-            channels[(channel_id, bot_id)] = json.loads(data)
+            channel = json_loads(data)
+            channels[(channel_id, bot_id)] = channel
+            _l1_put(key, channel, now)
         else:
             logger.warning(f"⚠️ Канал не найден в Redis кеш: channel_id={channel_id}, bot_id={bot_id}")
     return channels
 
 
+def _l1_put(key: str, channel: dict, now: float):
+    # Пока ждали MGET, канал могли изменить — старую версию в L1 не сохраняем
+    if channel.get("version", 0) < _invalidated_versions.get(key, 0):
+        return
+
+    _l1_cache[key] = (now + L1_TTL, channel)
+    _l1_cache.move_to_end(key)
+    while len(_l1_cache) > L1_MAX_SIZE:
+        _l1_cache.popitem(last=False)
+
+
+def invalidate_l1(key: str, version: int):
+    _l1_cache.pop(key, None)
+    if len(_invalidated_versions) >= L1_MAX_SIZE:
+        _invalidated_versions.clear()
+    _invalidated_versions[key] = max(version, _invalidated_versions.get(key, 0))
+
+
+async def listen_channel_invalidations():
+    """Слушает pub/sub и выкидывает изменённые каналы из L1"""
+    pubsub = redis.pubsub()
+    try:
+        await pubsub.subscribe(CHANNEL_INVALIDATION_CHANNEL)
+        # Пока не были подписаны, могли пропустить инвалидации — начинаем с чистого L1
+        _l1_cache.clear()
+
+        async for message in pubsub.listen():
+            if message["type"] != "message":
+                continue
+            try:
+                data = json_loads(message["data"])
+                invalidate_l1(data["key"], data["version"])
+            except (ValueError, KeyError) as e:
+                logger.warning(f"⚠️ Bad channel invalidation message: {message['data']!r} ({e})")
+    finally:
+        await pubsub.aclose()
+
+
 async def remove_channel_from_cache(channel_id: int, bot_id: int):
     key = _make_redis_key(channel_id, bot_id)
-    result = await redis.delete(key)
+
+    pipe = redis.pipeline()
+    pipe.delete(key)
+    pipe.publish(
+        CHANNEL_INVALIDATION_CHANNEL,
+        json_dumps({"key": key, "version": _make_version()}),
+    )
+    result, _ = await pipe.execute()
 
     if result:
         logger.info(f"🧹 Канал (ID={channel_id}, bot_id={bot_id}) удалён из кеша Redis")
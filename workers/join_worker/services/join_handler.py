@@ -1,80 +1,122 @@
 import asyncio
+import os
+import time
 
-from aiogram.types import (
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
-    KeyboardButton,
-    ReplyKeyboardMarkup,
-)
-from sqlalchemy import select, tuple_
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert
 
 from app.database.base.session import async_session
 from app.database.models.member import ChannelMember
+from app.redis_queue.rate_limiter import acquire
 from app.utils.logger import logger
-from workers.join_worker.services.bot_cache import get_bot
+from workers.join_worker.services.approve_scheduler import (
+    claim_due_approvals,
+    complete_approvals,
+    parse_member,
+    schedule_approve,
+)
+from workers.join_worker.services.bot_cache import bots_changed, get_bot, get_existing_bot_ids
 from workers.join_worker.services.channel_cache import get_channel, get_channels_bulk
+from workers.join_worker.services.member_index import add_members, filter_known_members
+from workers.join_worker.services.message_templates import get_channel_templates
 
+# Лимит запросов к Bot API на один токен, общий для всех реплик join_worker
+JOIN_BOT_RATE = float(os.getenv("JOIN_BOT_RATE", 25))  # requests per second
+JOIN_BOT_BURST = int(os.getenv("JOIN_BOT_BURST", 30))
 
-async def handle_join_batch(payloads: list):
-    if not payloads:
-        return
 
-    async with async_session() as session:
-        keys = set((p["chat_id"], p["user_id"], p["bot_id"]) for p in payloads)
-
-        channels = await get_channels_bulk([
-            (chat_id, bot_id)
-            for chat_id, _, bot_id in keys
+async def handle_join_batch(payloads: list) -> float:
+    """
+    Возвращает длительность фазы Redis + база (каналы, индекс участников, INSERT).
+    Только она растёт с размером батча — по ней BatchController подбирает размер.
+    Отправки в Bot API и ожидание токенов бота от размера батча не зависят.
+    """
+    if not payloads:
+        return 0.0
+
+    started = time.monotonic()
+    # Одинаковые события внутри батча (chat_member + chat_join_request) обрабатываем один раз
+    unique_payloads = {}
+    for p in payloads:
+        unique_payloads.setdefault((p["chat_id"], p["user_id"], p["bot_id"]), p)
+    keys = unique_payloads.keys()
+
+    channels = await get_channels_bulk(list({(chat_id, bot_id) for chat_id, _, bot_id in keys}))
+
+    # Получаем ботов (если get_bot у тебя sync — оставляем так, иначе тоже надо переписать)
+    bots = {bot_id: get_bot(bot_id) for _, _, bot_id in keys}
+
+    member_keys = [
+        (channels[(chat_id, bot_id)]["id"], user_id, bot_id)
+        for chat_id, user_id, bot_id in keys
+        if (chat_id, bot_id) in channels and bots.get(bot_id)
+    ]
+
+    # Уже известных участников отсекаем по индексу в Redis, в базу идут только остальные
+    known_members = await filter_known_members(member_keys)
+    unknown_members = [key for key in member_keys if key not in known_members]
+
+    new_members = await insert_new_members(unknown_members)
+    if new_members is None:
+        new_members = set()
+    else:
+        # После INSERT ... ON CONFLICT все эти участники точно есть в базе
+        await add_members(unknown_members)
+
+    batch_phase = time.monotonic() - started
+
+    tasks = []
+    for payload in unique_payloads.values():
+        tasks.append(process_payload(payload, channels, bots, new_members))
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning(f"⚠️ Exception in process_payload: {result}")
+
+    return batch_phase
+
+
+async def insert_new_members(member_keys: list[tuple[int, int, int]]) -> set | None:
+    """
+    Один INSERT ... ON CONFLICT DO NOTHING RETURNING на весь батч.
+    Возвращает ключи (channel_id, user_id, bot_id) реально добавленных участников —
+    всё остальное уже было в базе. Дубликат больше не откатывает весь батч.
+    None — если вставка не удалась.
+    """
+    if not member_keys:
+        return set()
+
+    stmt = (
+        insert(ChannelMember)
+        .values([
+            {
+                "channel_id": channel_id,
+                "user_id": user_id,
+                "bot_id": bot_id,
+                "is_available_for_broadcast": False,
+            }
+            for channel_id, user_id, bot_id in member_keys
         ])
+        .on_conflict_do_nothing(constraint="uix_bot_channel_user")
+        .returning(ChannelMember.channel_id, ChannelMember.user_id, ChannelMember.bot_id)
+    )
 
-        # Получаем ботов (если get_bot у тебя sync — оставляем так, иначе тоже надо переписать)
-        bots = {bot_id: get_bot(bot_id) for _, _, bot_id in keys}
-
-        existing_members_result = await session.execute(
-            select(ChannelMember).where(
-                tuple_(
-                    ChannelMember.channel_id,
-                    ChannelMember.user_id,
-                    ChannelMember.bot_id,
-                ).in_(
-                    [
-                        (channels.get((chat_id, bot_id))["id"], user_id, bot_id)
-                        for chat_id, user_id, bot_id in keys
-                        if channels.get((chat_id, bot_id))
-                    ]
-                )
-            )
-        )
-        existing_members = set(
-            (m.channel_id, m.user_id, m.bot_id)
-            for m in existing_members_result.scalars().all()
-        )
-
-        new_members = []
-
-        tasks = []
-        for payload in payloads:
-            tasks.append(process_payload(payload, channels, bots, existing_members, new_members))
-
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        for result in results:
-            if isinstance(result, Exception):
-                logger.warning(f"⚠️ Exception in process_payload: {result}")
-
-        if new_members:
-            try:
-                session.add_all(new_members)
-                await session.commit()
-                logger.info(f"📦 Bulk inserted {len(new_members)} members")
-            except IntegrityError:
-                await session.rollback()
-                logger.warning(f"⚠️ Bulk insert failed due to IntegrityError")
+    try:
+        async with async_session() as session:
+            result = await session.execute(stmt)
+            inserted = set(tuple(row) for row in result.fetchall())
+            await session.commit()
+    except Exception as e:
+        # Без базы всё равно одобряем заявки — считаем всех уже известными участниками
+        logger.error(f"❌ Bulk insert of members failed: {e}")
+        return None
 
+    logger.info(f"📦 Bulk inserted {len(inserted)} of {len(member_keys)} members")
+    return inserted
 
 
-async def process_payload(payload, channels, bots, existing_members, new_members):
+async def process_payload(payload, channels, bots, new_members):
     user_id = payload["user_id"]
     chat_id = payload["chat_id"]
     bot_id = payload["bot_id"]
@@ -90,7 +132,7 @@ async def process_payload(payload, channels, bots, existing_members, new_members
 
     member_key = (channel["id"], user_id, bot_id)
 
-    if member_key in existing_members:
+    if member_key not in new_members:
         logger.info(
             f"ℹ️ Member already in DB: user_id={user_id}, bot_id={bot_id}"
         )
@@ -100,12 +142,6 @@ async def process_payload(payload, channels, bots, existing_members, new_members
     if channel["captcha_enabled"]:
         await send_captcha(bot, user_id, channel)
 
-    new_members.append(
-        ChannelMember(
-            channel_id=channel["id"], user_id=user_id, bot_id=bot_id
-        )
-    )
-
     await approve_and_welcome(bot, channel, chat_id, user_id)
 
 
@@ -121,50 +157,18 @@ async def approve_and_welcome(bot, channel, chat_id, user_id):
 
 async def send_captcha(bot, user_id: int, channel):
     try:
-        kb = None
-        if channel["captcha_has_button"] and channel["captcha_button_text"]:
-            kb = ReplyKeyboardMarkup(
-                keyboard=[[KeyboardButton(text=channel["captcha_button_text"])]],
-                resize_keyboard=True,
-                one_time_keyboard=True,
-            )
-        await bot.send_message(
-            chat_id=user_id,
-            text=channel["captcha_text"] or "Пожалуйста, подтвердите, что вы не робот:",
-            reply_markup=kb,
-        )
+        template = get_channel_templates(channel).captcha
+        await throttle(bot)
+        await bot(template.build(user_id))
     except Exception as e:
         logger.warning(f"⚠️ Failed to send captcha to user {user_id}: {e}")
 
 
 async def send_welcome(bot, user_id: int, channel):
     try:
-        kb = None
-        if channel["has_button"]:
-            if (
-                    channel["button_type"] == "inline"
-                    and channel["button_text"]
-                    and channel["button_url"]
-            ):
-                kb = InlineKeyboardMarkup(
-                    inline_keyboard=[
-                        [
-                            InlineKeyboardButton(
-                                text=channel["button_text"], url=channel["button_url"]
-                            )
-                        ]
-                    ]
-                )
-            elif channel["button_type"] == "reply" and channel["button_text"]:
-                kb = ReplyKeyboardMarkup(
-                    keyboard=[[KeyboardButton(text=channel["button_text"])]],
-                    resize_keyboard=True,
-                    one_time_keyboard=True,
-                )
-
-        await bot.send_message(
-            chat_id=user_id, text=channel["welcome_message"], reply_markup=kb
-        )
+        template = get_channel_templates(channel).welcome
+        await throttle(bot)
+        await bot(template.build(user_id))
     except Exception as e:
         logger.warning(f"⚠️ Failed to send welcome to user {user_id}: {e}")
 
@@ -175,28 +179,79 @@ async def safe_approve(bot, channel, chat_id, user_id):
         if mode == "instant":
             await try_approve(bot, chat_id, user_id)
         elif mode == "1min":
-            asyncio.create_task(delayed_approve(bot, chat_id, user_id, 60))
+            await schedule_approve(channel["bot_id"], chat_id, user_id, 60)
         elif mode == "5min":
-            asyncio.create_task(delayed_approve(bot, chat_id, user_id, 300))
+            await schedule_approve(channel["bot_id"], chat_id, user_id, 300)
         elif mode and mode.endswith("s"):
             try:
                 delay = int(mode[:-1])
-                asyncio.create_task(delayed_approve(bot, chat_id, user_id, delay))
+                await schedule_approve(channel["bot_id"], chat_id, user_id, delay)
             except ValueError:
                 logger.error(f"❌ Invalid delay format: {mode}")
     except Exception as e:
         logger.warning(f"⚠️ safe_approve failed: {e}")
 
 
-async def delayed_approve(bot, chat_id: int, user_id: int, delay: int):
-    logger.info(f"⏱ Waiting {delay}s before approving user")
-    await asyncio.sleep(delay)
-    await try_approve(bot, chat_id, user_id)
+async def fire_due_approvals() -> int:
+    members = await claim_due_approvals()
+    if not members:
+        return 0
+
+    tasks = []
+    fired = []
+    missing: dict[int, list[str]] = {}
+    for member in members:
+        bot_id, chat_id, user_id = parse_member(member)
+        bot = get_bot(bot_id)
+        if not bot:
+            missing.setdefault(bot_id, []).append(member)
+            continue
+        tasks.append(try_approve(bot, chat_id, user_id))
+        fired.append(member)
+
+    await asyncio.gather(*tasks)
+    fired.extend(await drop_approvals_of_deleted_bots(missing))
+    await complete_approvals(fired)
+
+    logger.info(f"⏱ Fired {len(tasks)} scheduled approvals")
+    return len(fired)
+
+
+async def drop_approvals_of_deleted_bots(missing: dict[int, list[str]]) -> list[str]:
+    """
+    Бота нет в локальном кеше. Если он есть в базе — кеш просто отстал: заявки
+    не трогаем, после лиза они снова станут due. Выбрасываем только заявки
+    ботов, удалённых из базы.
+    """
+    if not missing:
+        return []
+
+    try:
+        existing = await get_existing_bot_ids(list(missing))
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to check bots for scheduled approvals, retrying after lease: {e}")
+        return []
+
+    dropped = []
+    for bot_id, bot_members in missing.items():
+        if bot_id in existing:
+            logger.warning(f"⚠️ Bot not in cache yet, postponing {len(bot_members)} approvals: bot_id={bot_id}")
+            bots_changed.set()
+        else:
+            logger.warning(f"⚠️ Bot deleted, dropping {len(bot_members)} scheduled approvals: bot_id={bot_id}")
+            dropped.extend(bot_members)
+    return dropped
 
 
 async def try_approve(bot, chat_id: int, user_id: int):
     try:
+        await throttle(bot)
         await bot.approve_chat_join_request(chat_id, user_id)
         logger.info(f"✅ Approved join request for user {user_id} in chat {chat_id}")
     except Exception as e:
         logger.warning(f"⚠️ Failed to approve user: {e}")
+
+
+async def throttle(bot):
+    # Ключ — Telegram ID бота из токена: лимиты Bot API считаются по токену
+    await acquire(f"bot:{bot.id}", JOIN_BOT_RATE, JOIN_BOT_BURST)
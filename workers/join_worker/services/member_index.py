@@ -0,0 +1,157 @@
+# workers/join_worker/services/member_index.py
+
+import asyncio
+import sys
+
+from redis.exceptions import RedisError
+from sqlalchemy import func, select
+
+from app.database.base.session import async_session
+from app.database.models.channel import Channel
+from app.database.models.member import ChannelMember
+from app.redis_queue.connection import redis
+from app.utils.logger import logger
+
+# Индекс участников в Redis: set user_id на канал.
+# Это только кеш "точно есть в базе": промах не страшен (дальше сработает
+# INSERT ... ON CONFLICT), поэтому индекс можно заполнять лениво и пересобирать в любой момент.
+# Лишняя запись опасна (новый участник не получит капчу), поэтому при удалении
+# участников из базы индекс канала обязательно удаляем.
+REBUILD_PAGE_SIZE = 10_000
+
+
+def _make_key(channel_pk: int, bot_id: int) -> str:
+    return f"members:{bot_id}:{channel_pk}"
+
+
+def _group_by_channel(member_keys) -> dict[tuple[int, int], list[int]]:
+    groups = {}
+    for channel_pk, user_id, bot_id in member_keys:
+        groups.setdefault((channel_pk, bot_id), []).append(user_id)
+    return groups
+
+
+async def filter_known_members(member_keys: list[tuple[int, int, int]]) -> set:
+    """
+    Возвращает ключи (channel_id, user_id, bot_id), которые уже есть в индексе.
+    Один pipeline со SMISMEMBER на каждый канал батча.
+    """
+    if not member_keys:
+        return set()
+
+    groups = _group_by_channel(member_keys)
+    pipe = redis.pipeline(transaction=False)
+    for (channel_pk, bot_id), user_ids in groups.items():
+        pipe.smismember(_make_key(channel_pk, bot_id), user_ids)
+
+    try:
+        results = await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"⚠️ Member index unavailable, falling back to DB: {e}")
+        return set()
+
+    known = set()
+    for ((channel_pk, bot_id), user_ids), flags in zip(groups.items(), results):
+        for user_id, flag in zip(user_ids, flags):
+            if flag:
+                known.add((channel_pk, user_id, bot_id))
+    return known
+
+
+async def add_members(member_keys):
+    if not member_keys:
+        return
+
+    pipe = redis.pipeline(transaction=False)
+    for (channel_pk, bot_id), user_ids in _group_by_channel(member_keys).items():
+        pipe.sadd(_make_key(channel_pk, bot_id), *user_ids)
+
+    try:
+        await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"⚠️ Failed to update member index: {e}")
+
+
+async def drop_member_index(channel_pk: int, bot_id: int):
+    await redis.delete(_make_key(channel_pk, bot_id))
+
+
+async def rebuild_member_index(channel_pk: int, bot_id: int) -> int:
+    """Пересобирает индекс канала из channel_members постранично (keyset по user_id)"""
+    key = _make_key(channel_pk, bot_id)
+    tmp_key = f"{key}:rebuild"
+    await redis.delete(tmp_key)
+
+    total = 0
+    last_user_id = None
+    async with async_session() as session:
+        while True:
+            query = (
+                select(ChannelMember.user_id)
+                .where(ChannelMember.channel_id == channel_pk, ChannelMember.bot_id == bot_id)
+                .order_by(ChannelMember.user_id)
+                .limit(REBUILD_PAGE_SIZE)
+            )
+            if last_user_id is not None:
+                query = query.where(ChannelMember.user_id > last_user_id)
+
+            user_ids = (await session.execute(query)).scalars().all()
+            if not user_ids:
+                break
+
+            await redis.sadd(tmp_key, *user_ids)
+            total += len(user_ids)
+            last_user_id = user_ids[-1]
+
+    if total:
+        await redis.rename(tmp_key, key)
+    else:
+        await redis.delete(key)
+
+    logger.info(f"🧱 Rebuilt member index {key}: {total} members")
+    return total
+
+
+async def check_member_index(channel_pk: int, bot_id: int) -> bool:
+    """
+    Сверяет размер индекса с базой. Индекс заполняется лениво, поэтому меньше
+    базы — норма; ошибка только если в индексе больше участников, чем в базе
+    (остались удалённые). Подмену не ловит: устаревший user_id при том же размере
+    (один удалён, другой не попал в индекс) даёт ложное «уже участник» и пропуск
+    капчи — от этого только полная пересборка (--rebuild).
+    """
+    async with async_session() as session:
+        result = await session.execute(
+            select(func.count()).where(
+                ChannelMember.channel_id == channel_pk, ChannelMember.bot_id == bot_id
+            )
+        )
+        db_count = result.scalar_one()
+
+    index_count = await redis.scard(_make_key(channel_pk, bot_id))
+    if index_count > db_count:
+        logger.warning(
+            f"⚠️ Member index mismatch for channel {channel_pk} (bot_id={bot_id}): "
+            f"index={index_count}, db={db_count}"
+        )
+        return False
+    return True
+
+
+async def main(rebuild_all: bool = False):
+    async with async_session() as session:
+        result = await session.execute(select(Channel.id, Channel.bot_id))
+        channels = result.fetchall()
+
+    rebuilt = 0
+    for channel_pk, bot_id in channels:
+        if rebuild_all or not await check_member_index(channel_pk, bot_id):
+            await rebuild_member_index(channel_pk, bot_id)
+            rebuilt += 1
+
+    logger.info(f"✅ Checked {len(channels)} member indexes, rebuilt {rebuilt}")
+
+
+if __name__ == "__main__":
+    # python -m workers.join_worker.services.member_index [--rebuild]
+    asyncio.run(main(rebuild_all="--rebuild" in sys.argv))
@@ -0,0 +1,118 @@
+# workers/join_worker/services/message_templates.py
+
+import json
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from aiogram.methods import SendMessage
+from aiogram.types import (
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    KeyboardButton,
+    ReplyKeyboardMarkup,
+)
+
+from workers.join_worker.services.bot_cache import DEFAULT_PARSE_MODE
+
+DEFAULT_CAPTCHA_TEXT = "Пожалуйста, подтвердите, что вы не робот:"
+TEMPLATES_MAX_SIZE = 10_000
+
+# (channels.id, version) -> ChannelTemplates
+_templates: OrderedDict[tuple[int, int], "ChannelTemplates"] = OrderedDict()
+
+
+@dataclass(frozen=True)
+class MessageTemplate:
+    text: str
+    parse_mode: str | None
+    # Разметка клавиатуры, уже сериализованная в JSON: aiogram отправляет строку как есть
+    reply_markup: str | None
+
+    def build(self, chat_id: int) -> SendMessage:
+        # model_construct — без pydantic-валидации на каждого пользователя
+        return SendMessage.model_construct(
+            chat_id=chat_id,
+            text=self.text,
+            parse_mode=self.parse_mode,
+            reply_markup=self.reply_markup,
+        )
+
+
+@dataclass(frozen=True)
+class ChannelTemplates:
+    welcome: MessageTemplate
+    captcha: MessageTemplate
+
+
+def get_channel_templates(channel: dict) -> ChannelTemplates:
+    """Шаблоны собираются один раз на версию настроек канала"""
+    key = (channel["id"], channel.get("version", 0))
+
+    templates = _templates.get(key)
+    if templates:
+        _templates.move_to_end(key)
+        return templates
+
+    templates = compile_channel_templates(channel)
+    _templates[key] = templates
+    while len(_templates) > TEMPLATES_MAX_SIZE:
+        _templates.popitem(last=False)
+    return templates
+
+
+def compile_channel_templates(channel: dict) -> ChannelTemplates:
+    return ChannelTemplates(
+        welcome=MessageTemplate(
+            text=channel["welcome_message"],
+            parse_mode=DEFAULT_PARSE_MODE.parse_mode,
+            reply_markup=_serialize(_welcome_keyboard(channel)),
+        ),
+        captcha=MessageTemplate(
+            text=channel["captcha_text"] or DEFAULT_CAPTCHA_TEXT,
+            parse_mode=DEFAULT_PARSE_MODE.parse_mode,
+            reply_markup=_serialize(_captcha_keyboard(channel)),
+        ),
+    )
+
+
+def _welcome_keyboard(channel: dict):
+    if not channel["has_button"]:
+        return None
+
+    if (
+            channel["button_type"] == "inline"
+            and channel["button_text"]
+            and channel["button_url"]
+    ):
+        return InlineKeyboardMarkup(
+            inline_keyboard=[
+                [
+                    InlineKeyboardButton(
+                        text=channel["button_text"], url=channel["button_url"]
+                    )
+                ]
+            ]
+        )
+    elif channel["button_type"] == "reply" and channel["button_text"]:
+        return ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text=channel["button_text"])]],
+            resize_keyboard=True,
+            one_time_keyboard=True,
+        )
+    return None
+
+
+def _captcha_keyboard(channel: dict):
+    if channel["captcha_has_button"] and channel["captcha_button_text"]:
+        return ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text=channel["captcha_button_text"])]],
+            resize_keyboard=True,
+            one_time_keyboard=True,
+        )
+    return None
+
+
+def _serialize(markup) -> str | None:
+    if markup is None:
+        return None
+    return json.dumps(markup.model_dump(exclude_none=True))
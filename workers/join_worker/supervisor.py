@@ -0,0 +1,176 @@
+# workers/join_worker/supervisor.py
+
+import asyncio
+import multiprocessing
+import os
+import time
+
+from app.redis_queue.worker_registry import INSTANCE_ID, get_fleet, keep_lease
+from app.utils.logger import logger
+from app.utils.runtime import run
+
+# Несколько процессов join_worker в одном контейнере: у каждого свой event loop,
+# свои пулы Redis/Postgres и свои партиции очереди (JOIN_QUEUE_PARTITIONS).
+# Упавший процесс перезапускается с экспоненциальной задержкой.
+# Каждый процесс — свой пул Postgres, свои сессии aiohttp ботов и своя копия
+# кеша каналов, поэтому по умолчанию процессов немного (см. docker-compose.yml)
+JOIN_WORKER_PROCESSES = int(os.getenv("JOIN_WORKER_PROCESSES", min(os.cpu_count() or 1, 4)))
+# Соединений с Postgres на весь supervisor (на реплику join_worker): делятся
+# поровну между процессами — pool_size + max_overflow каждого
+JOIN_DB_CONNECTIONS = int(os.getenv("JOIN_DB_CONNECTIONS", 20))
+
+MONITOR_INTERVAL = 1  # seconds
+RESTART_BACKOFF_MIN = 1  # seconds
+RESTART_BACKOFF_MAX = 60  # seconds
+# Процесс, проработавший дольше, считается здоровым — задержка сбрасывается
+STABLE_UPTIME = 60  # seconds
+SHUTDOWN_TIMEOUT = 10  # seconds
+
+# spawn, а не fork: дочерний процесс не наследует соединения и event loop родителя
+_mp = multiprocessing.get_context("spawn")
+
+
+def db_pool_limits(processes: int, budget: int = JOIN_DB_CONNECTIONS) -> tuple[int, int]:
+    """
+    (pool_size, max_overflow) одного процесса: вместе не больше budget соединений,
+    но не меньше двух на процесс — при слишком большом числе процессов бюджет превышается
+    """
+    per_process = max(2, budget // max(1, processes))
+    pool_size = max(1, per_process // 2)
+    return pool_size, per_process - pool_size
+
+
+def run_worker(partitions: list[int], supervisor_id: str, processes: int):
+    # Настройки очереди и пула читаются при импорте, поэтому выставляем их до импорта воркера
+    os.environ["JOIN_WORKER_PARTITIONS"] = ",".join(map(str, partitions))
+    os.environ["JOIN_SUPERVISOR_ID"] = supervisor_id
+    pool_size, max_overflow = db_pool_limits(processes)
+    os.environ["DB_POOL_SIZE"] = str(pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = str(max_overflow)
+
+    from workers.join_worker import worker
+
+    run(worker.main, f"join_worker[{os.environ['JOIN_WORKER_PARTITIONS']}]")
+
+
+class WorkerSlot:
+    def __init__(self, index: int, partitions: list[int], processes: int):
+        self.index = index
+        self.partitions = partitions
+        self.processes = processes
+        self.process: multiprocessing.Process | None = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.backoff = RESTART_BACKOFF_MIN
+        self.restart_at = 0.0
+
+    def start(self):
+        self.process = _mp.Process(
+            target=run_worker,
+            args=(self.partitions, INSTANCE_ID, self.processes),
+            name=f"join_worker-{self.index}",
+            daemon=False,
+        )
+        self.process.start()
+        self.started_at = time.monotonic()
+        logger.info(f"🚀 Started join worker #{self.index} (pid={self.process.pid}, partitions={self.partitions})")
+
+    def check(self):
+        if self.process and self.process.is_alive():
+            return
+
+        now = time.monotonic()
+        if self.process:
+            uptime = now - self.started_at
+            logger.error(
+                f"💥 Join worker #{self.index} exited with code {self.process.exitcode} "
+                f"after {uptime:.0f}s, restarting in {self.backoff}s"
+            )
+            self.backoff = RESTART_BACKOFF_MIN if uptime >= STABLE_UPTIME else self.backoff
+            self.restart_at = now + self.backoff
+            self.backoff = min(self.backoff * 2, RESTART_BACKOFF_MAX)
+            self.process = None
+            self.restarts += 1
+
+        if now >= self.restart_at:
+            self.start()
+
+
+def assign_partitions(processes: int, partitions: int, backend: str = "list") -> list[list[int]]:
+    # Для списков больше процессов, чем партиций, не нужно: лишние простаивали бы.
+    # Стрим читают все процессы через consumer group, партиции там нужны только
+    # для дочитывания списков — лишние процессы делят их между собой
+    if backend != "stream":
+        processes = min(processes, partitions)
+    processes = max(1, processes)
+    return [list(range(i % partitions, partitions, processes)) for i in range(processes)]
+
+
+async def supervisor_stats(slots: list[WorkerSlot]) -> dict:
+    stats = {
+        "processes": len(slots),
+        "alive": sum(1 for slot in slots if slot.process and slot.process.is_alive()),
+        "restarts": sum(slot.restarts for slot in slots),
+    }
+
+    # Суммарная нагрузка дочерних процессов из их записей в реестре
+    children = [w for w in await get_fleet() if w.get("supervisor") == INSTANCE_ID]
+    stats["inflight_payloads"] = sum(int(w.get("inflight_payloads") or 0) for w in children)
+    stats["queue_depth"] = sum(int(w.get("queue_depth") or 0) for w in children)
+    return stats
+
+
+async def supervise():
+    # Не на уровне модуля: spawn заново импортирует этот модуль в каждом дочернем процессе,
+    # а join_queue читает свои партиции из окружения при импорте
+    from app.redis_queue.join_queue import JOIN_QUEUE_BACKEND, JOIN_QUEUE_PARTITIONS
+
+    assignment = assign_partitions(JOIN_WORKER_PROCESSES, JOIN_QUEUE_PARTITIONS, JOIN_QUEUE_BACKEND)
+    slots = [WorkerSlot(index, partitions, len(assignment)) for index, partitions in enumerate(assignment)]
+    logger.info(
+        f"🧭 Join supervisor started: {len(slots)} processes, {JOIN_QUEUE_PARTITIONS} partitions"
+    )
+
+    stats = {}
+
+    async def refresh_stats():
+        while True:
+            try:
+                stats.update(await supervisor_stats(slots))
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to collect join worker stats: {e}")
+            await asyncio.sleep(MONITOR_INTERVAL * 5)
+
+    stats_task = asyncio.create_task(refresh_stats())
+    lease_task = asyncio.create_task(keep_lease("join_supervisor", lambda: stats))
+
+    # Остановка — по SIGTERM/SIGINT через app.utils.runtime: задачу отменяют, дальше finally
+    try:
+        while True:
+            for slot in slots:
+                slot.check()
+            await asyncio.sleep(MONITOR_INTERVAL)
+    finally:
+        stats_task.cancel()
+        lease_task.cancel()
+        await asyncio.gather(stats_task, lease_task, return_exceptions=True)
+        shutdown(slots)
+
+
+def shutdown(slots: list[WorkerSlot]):
+    logger.info("🛑 Stopping join workers...")
+    processes = [slot.process for slot in slots if slot.process]
+    for process in processes:
+        process.terminate()
+
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.warning(f"⚠️ Join worker pid={process.pid} did not stop, killing")
+            process.kill()
+            process.join()
+
+
+if __name__ == "__main__":
+    run(supervise, "join_supervisor")
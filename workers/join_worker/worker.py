@@ -1,87 +1,228 @@
 # workers/join_worker/worker.py
 
 import asyncio
-import json
 import os
-import time
 from typing import Dict, List
 
-from app.redis_queue.connection import redis
+from app.redis_queue.join_queue import (
+    JOIN_QUEUE_BACKEND,
+    JOIN_STREAM_TOUCH_INTERVAL,
+    JOIN_WORKER_PARTITIONS,
+    JoinBatch,
+    ack_join_batch,
+    dequeue_join_batch,
+    init_join_queue,
+    touch_join_events,
+)
+from app.redis_queue.worker_registry import keep_lease
 from app.utils.logger import logger
-from workers.join_worker.services.bot_cache import init_bot_cache
-from workers.join_worker.services.channel_cache import init_channel_cache
-from workers.join_worker.services.join_handler import handle_join_batch
-
-BATCH_SIZE = 200
+from app.utils.runtime import on_shutdown, run
+from workers.join_worker.services.bot_cache import (
+    bots_changed,
+    close_bot_cache,
+    init_bot_cache,
+    listen_bot_changes,
+)
+from workers.join_worker.services.channel_cache import (
+    init_channel_cache,
+    listen_channel_invalidations,
+    sync_channel_cache,
+)
+from workers.join_worker.services.approve_scheduler import APPROVE_POLL_INTERVAL
+from workers.join_worker.services.batch_controller import BatchController
+from workers.join_worker.services.join_handler import fire_due_approvals, handle_join_batch
+
+# Начальный размер батча, дальше его подбирает BatchController
+BATCH_SIZE = int(os.getenv("JOIN_BATCH_SIZE", 200))
 BATCH_TIMEOUT = 1
+# Сколько батчей обрабатываются одновременно, пока читатель уже набирает следующие
+JOIN_PIPELINE_WORKERS = int(os.getenv("JOIN_PIPELINE_WORKERS", 4))
+# Сколько прочитанных батчей может ждать свободного обработчика
+MAX_QUEUED_BATCHES = JOIN_PIPELINE_WORKERS
+# Мягкий потолок событий в работе: читатель не берёт новый батч, пока он превышен
+MAX_INFLIGHT_PAYLOADS = int(os.getenv("JOIN_MAX_INFLIGHT_PAYLOADS", 2000))
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+CHANNEL_SYNC_INTERVAL = 5
+# Боты обновляются по сигналу от главного бота, таймер — только страховка
+BOT_CACHE_REFRESH_INTERVAL = 300
+# Выставляет supervisor.py, если процесс запущен им
+SUPERVISOR_ID = os.getenv("JOIN_SUPERVISOR_ID")
+
+
+class InflightLimiter:
+    def __init__(self, max_payloads: int):
+        self.max_payloads = max_payloads
+        self.payloads = 0
+        self.batches = 0
+        # Неподтверждённые записи стрима из батчей в работе
+        self._ack_ids: dict[int, list[bytes]] = {}
+        self._cond = asyncio.Condition()
+
+    async def wait_for_capacity(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.payloads < self.max_payloads)
+
+    def add(self, batch: JoinBatch):
+        self.payloads += len(batch.payloads)
+        self.batches += 1
+        if batch.ack_ids:
+            self._ack_ids[id(batch)] = batch.ack_ids
+
+    def ack_ids(self) -> list[bytes]:
+        return [ack_id for ids in self._ack_ids.values() for ack_id in ids]
+
+    async def release(self, batch: JoinBatch):
+        async with self._cond:
+            self.payloads -= len(batch.payloads)
+            self.batches -= 1
+            self._ack_ids.pop(id(batch), None)
+            self._cond.notify_all()
+
+
+inflight = InflightLimiter(MAX_INFLIGHT_PAYLOADS)
+batch_controller = BatchController(BATCH_SIZE)
+
+
+def worker_stats() -> dict:
+    # Нагрузка реплики и решения контроллера батчей — для реестра воркеров
+    return {
+        "supervisor": SUPERVISOR_ID,
+        "partitions": ",".join(map(str, JOIN_WORKER_PARTITIONS)),
+        "inflight_payloads": inflight.payloads,
+        "inflight_batches": inflight.batches,
+        **batch_controller.metrics(),
+    }
 
 
-async def heartbeat(name: str):
-    await redis.set(f"worker_status:{name}", int(time.time()))
+async def refresh_caches():
+    # После полной загрузки при старте тянем из базы только изменённые каналы
+    while True:
+        await asyncio.sleep(CHANNEL_SYNC_INTERVAL)
+        try:
+            await sync_channel_cache()
+        except Exception as e:
+            logger.error(f"❌ Failed to sync channel cache: {e}")
 
 
-async def refresh_caches():
+async def refresh_bot_cache():
     while True:
         try:
-            logger.info("🔄 Refreshing caches...")
+            await asyncio.wait_for(bots_changed.wait(), timeout=BOT_CACHE_REFRESH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        bots_changed.clear()
+
+        try:
             await init_bot_cache()
-            await init_channel_cache()
-            logger.info("✅ Caches refreshed successfully")
         except Exception as e:
-            logger.error(f"❌ Failed to refresh caches: {e}")
-        await asyncio.sleep(20)  # Обновляем раз в 60 секунд
+            logger.error(f"❌ Failed to refresh bot cache: {e}")
+
+
+async def keep_listening(listener):
+    # Переподписываемся при обрыве соединения с Redis
+    while True:
+        try:
+            await listener()
+        except Exception as e:
+            logger.error(f"❌ Cache invalidation listener {listener.__name__} failed: {e}")
+        await asyncio.sleep(1)
+
+
+async def keep_inflight_claimed():
+    # Пока батч ждёт обработчика или токенов бота, его события не должна
+    # перехватить другая реплика (XAUTOCLAIM) — иначе двойные приветствия
+    while True:
+        await asyncio.sleep(JOIN_STREAM_TOUCH_INTERVAL)
+        try:
+            await touch_join_events(inflight.ack_ids())
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to touch in-flight join events: {e}")
+
+
+async def approve_scheduler():
+    # Не больше APPROVE_BATCH_SIZE одобрений за один тик — ограничиваем темп
+    while True:
+        try:
+            await fire_due_approvals()
+        except Exception as e:
+            logger.error(f"❌ Failed to fire scheduled approvals: {e}")
+        await asyncio.sleep(APPROVE_POLL_INTERVAL)
 
 
-async def process_batch(tasks: List[Dict]):
+async def process_batch(tasks: List[Dict]) -> float:
     if not tasks:
-        return
+        return 0.0
 
     logger.info(f"📦 Processing batch of {len(tasks)} tasks")
-    await handle_join_batch(tasks)
+    return await handle_join_batch(tasks)
+
+
+async def read_batches(queue: asyncio.Queue):
+    """Читатель: набирает батчи и отдаёт обработчикам, не дожидаясь окончания предыдущих"""
+    while True:
+        try:
+            await inflight.wait_for_capacity()
+
+            # Один скрипт на батч: события по кругу из очередей ботов, без запроса на каждое событие
+            batch = await dequeue_join_batch(
+                batch_controller.batch_size,
+                timeout=BATCH_TIMEOUT,
+                linger=batch_controller.linger,
+            )
+            batch_controller.on_dequeue(max(len(batch.ack_ids), len(batch.payloads)), batch.depth)
+
+            if batch.payloads or batch.ack_ids:
+                inflight.add(batch)
+                # Если все обработчики заняты — ждём здесь (backpressure)
+                await queue.put(batch)
+
+        except Exception as e:
+            logger.error(f"🔥 Error in worker loop: {e}")
+            await asyncio.sleep(1)
+
+
+async def process_batches(queue: asyncio.Queue):
+    while True:
+        batch = await queue.get()
+        try:
+            # Контроллеру — только фаза Redis + база: ожидание в очереди (backpressure),
+            # запросы к Bot API и темп токена бота от размера батча не зависят
+            batch_phase = await process_batch(batch.payloads)
+            batch_controller.on_processed(len(batch.payloads), batch_phase)
+            # Для stream подтверждаем только после обработки — иначе событие переберёт другая реплика
+            await ack_join_batch(batch)
+        except Exception as e:
+            logger.error(f"🔥 Error while processing batch: {e}")
+        finally:
+            await inflight.release(batch)
+            queue.task_done()
 
 
 async def main():
     logger.info(f"🚀 Join worker started... (Redis: {REDIS_URL})")
 
+    await init_join_queue()
+
     # Init caches
     await init_bot_cache()
     await init_channel_cache()
+    on_shutdown(close_bot_cache)
 
     # Запускаем фоновую задачу обновления кэша
     asyncio.create_task(refresh_caches())
+    asyncio.create_task(refresh_bot_cache())
+    asyncio.create_task(keep_listening(listen_channel_invalidations))
+    asyncio.create_task(keep_listening(listen_bot_changes))
+    asyncio.create_task(approve_scheduler())
+    asyncio.create_task(keep_lease("join_worker", worker_stats))
+    if JOIN_QUEUE_BACKEND == "stream":
+        asyncio.create_task(keep_inflight_claimed())
 
-    tasks_buffer = []
-    last_batch_time = time.time()
+    queue = asyncio.Queue(maxsize=MAX_QUEUED_BATCHES)
+    processors = [asyncio.create_task(process_batches(queue)) for _ in range(JOIN_PIPELINE_WORKERS)]
 
-    while True:
-        try:
-            task = await redis.blpop("join_queue", timeout=0.1)
-
-            if task:
-                _, data = task
-                payload = json.loads(data)
-                tasks_buffer.append(payload)
-
-                current_time = time.time()
-                if len(tasks_buffer) >= BATCH_SIZE or (
-                    tasks_buffer and current_time - last_batch_time >= BATCH_TIMEOUT
-                ):
-                    await process_batch(tasks_buffer)
-                    tasks_buffer = []
-                    last_batch_time = current_time
-            else:
-                if tasks_buffer:
-                    await process_batch(tasks_buffer)
-                    tasks_buffer = []
-                    last_batch_time = time.time()
-
-            await heartbeat("join_worker:base")
-
-        except Exception as e:
-            logger.error(f"🔥 Error in worker loop: {e}")
-            await asyncio.sleep(1)
+    await asyncio.gather(read_batches(queue), *processors)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main, "join_worker")
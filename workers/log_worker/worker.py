@@ -1,19 +1,21 @@
 import asyncio
-import json
 import os
-import time
 
 from redis.asyncio import Redis
 
+from app.redis_queue.codec import decode_message
+from app.redis_queue.worker_registry import keep_lease
 from app.utils.logger import logger
-from workers.log_worker.services.log_handler import flush_logs, handle_log_entry
+from app.utils.runtime import on_shutdown, run
+from workers.log_worker.services.log_handler import flush_logs, handle_log_entry, log_buffer
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
-redis_client = Redis.from_url(REDIS_URL, decode_responses=True)
+# Без decode_responses: логи в очереди лежат в бинарном формате (app/redis_queue/codec.py)
+redis_client = Redis.from_url(REDIS_URL)
 
 
-async def heartbeat(name: str):
-    await redis_client.set(f"worker_status:{name}", int(time.time()))
+def worker_stats() -> dict:
+    return {"buffered_logs": sum(len(messages) for messages in log_buffer.values())}
 
 
 async def periodic_flush(interval: int = 5):
@@ -30,22 +32,22 @@ async def main():
 
     # 🔄 Запускаем фоновую задачу на регулярную отправку логов
     asyncio.create_task(periodic_flush())
+    asyncio.create_task(keep_lease("log_worker", worker_stats))
+    on_shutdown(redis_client.aclose)
 
     while True:
         try:
             task = await redis_client.blpop("admin_logs", timeout=1)
             if task:
                 _, raw_data = task
-                log_data = json.loads(raw_data)
+                log_data = decode_message(raw_data)
                 logger.info(f"📨 Получен лог: {log_data}")
                 asyncio.create_task(handle_log_entry(log_data))
 
-            await heartbeat("log_worker:base")
-
         except Exception as e:
             logger.exception(f"🔥 Ошибка в log worker loop: {e}")
             await asyncio.sleep(1)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main, "log_worker")